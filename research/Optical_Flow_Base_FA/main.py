@@ -1,26 +1,60 @@
 from sys import argv
-from tqdm import tqdm
 import numpy as np
-from numpy.lib.stride_tricks import sliding_window_view
 import math
 import sys
-import pdb
 import getopt
 import re
 import os
 import json
+import csv
+import hashlib
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
-from utils.optical_flow import get_vid_opt_flow
-from utils.stats import plot_entire_stat_tresh, analyze_hs, make_animation, compute_temporal_scales
+from utils.optical_flow import get_vid_opt_flow, FlowEngine
+from utils.stats import plot_entire_stat_tresh, analyze_hs, make_animation, compute_temporal_scales, \
+                        plot_fluctuation_maps, surrogate_test, plot_surrogate_test
 from utils.data_generator import bacterial_ds_generator
+from utils.fluctuation import compute_fluctuations, compute_fluctuation_maps, aggregate_signal, \
+                              signal_fluctuations, surrogate_fluctuations
+from utils.flow_stats import FlowStatistics
+from utils.profiling import StageProfiler, set_progress
+from utils.online import monitor
+
+logger = logging.getLogger(__name__)
+
+VIDEO_TYPES = ['.avi', '.mp4']
+
+# Параметры запуска, от которых зависят результаты обработки видео
+RESULT_PARAMS = ("record_duration", "base", "smin", "flow_method", "flow_scale", "flow_roi", "flow_value_range",
+                 "flow_params", "animation_backend", "tile_size", "flow_storage", "precision", "n_surrogates", 
+                 "surrogate_method", "surrogate_tile")
+
+SUMMARY_COLUMNS = ["video", "status", "frames", "crossover", "slope_l", "slope_h", 
+                   "aggregate_crossover", "aggregate_crossover_p", "aggregate_slope_l", "aggregate_slope_l_p", 
+                   "aggregate_slope_h", "aggregate_slope_h_p", "total_wall_s", "error"]
 
 def video_process(input_file: str, 
                   cache_file: str, 
                   output_animation_file: str, 
                   output_fluctuation_file: str, 
-                  temporal_scales: list):
+                  temporal_scales: list,
+                  workers: int = None,
+                  cache_max_bytes: int = None,
+                  animation_backend: str = "matplotlib",
+                  metrics_file: str = None,
+                  engine: FlowEngine = None,
+                  frame_count: int = None,
+                  tile_size: int = None,
+                  storage: str = "float32",
+                  precision: str = "double",
+                  n_surrogates: int = 0,
+                  surrogate_method: str = "shuffle",
+                  surrogate_tile: int = None):
     """Функция обработки видео. 
     - Вычисление оптического потока
     - Построение графиков
@@ -31,28 +65,356 @@ def video_process(input_file: str,
     :param cache_file: путь до кэша видео
     :param output_file_animation: путь сохранения анимации видео
     :param output_fluctuation_file: путь сохранения файла с флуктационной характеристикой
+    :param workers: количество процессов для вычисления оптического потока (None — последовательно)
+    :param cache_max_bytes: лимит размера каталога кэша оптического потока в байтах
+    :param animation_backend: способ отрисовки анимации ("matplotlib", "opencv"; None — без анимации)
+    :param metrics_file: путь к файлу метрик этапов (JSON Lines); None — запись печатается в stdout
+    :param engine: метод вычисления оптического потока (по умолчанию FlowEngine() — Farneback)
+    :param frame_count: номер кадра, до которого читается видео (по умолчанию — длина видео)
+    :param tile_size: размер блока в пикселях для карт перекреста и наклонов (None — карты не строятся);
+        карты сохраняются рядом с файлом флуктуационной характеристики (<имя>_maps.npz)
+    :param storage: формат хранения оптического потока в кэше ("float32", "float16", "int16")
+    :param precision: точность флуктуационного анализа ("double" — complex128, "single" — complex64)
+    :param n_surrogates: количество суррогатов для интервалов и p-значений перекреста и наклонов H(S) потока,
+        усредненного по кадру или блокам (0 — без проверки); оценки записываются в aggregate_crossover, 
+        aggregate_slope_l, aggregate_slope_h (с суффиксами _p и _ci), данные сохраняются рядом с файлом 
+        флуктуационной характеристики (<имя>_surrogates.npz)
+    :param surrogate_method: способ построения суррогатов ("shuffle" — перестановка, "phase" — рандомизация фаз)
+    :param surrogate_tile: размер блока усреднения потока для суррогатов (None — среднее по кадру)
+    :return: запись метрик этапов обработки
     """
     
-    vs_np, us_np = get_vid_opt_flow(input_file, cache_file)
-    vector_field = vs_np + 1j * us_np
+    profiler = StageProfiler()
+    flow_stats = FlowStatistics()
+    with profiler.stage("optical_flow"):
+        vs_np, us_np = get_vid_opt_flow(input_file, 
+                                        cache_file, 
+                                        stream=True, 
+                                        workers=workers, 
+                                        cache_max_bytes=cache_max_bytes,
+                                        flow_stats=flow_stats,
+                                        profiler=profiler,
+                                        engine=engine,
+                                        frame_count=frame_count,
+                                        storage=storage)
 
-    plot_entire_stat_tresh((vs_np.shape[1],vs_np.shape[2]), vs_np, us_np, thresh=0.5)
-    
-    vector_field = vs_np + 1j * us_np
-    compl_vars_ = []
-    for w_size in tqdm(temporal_scales):
-        window = sliding_window_view(vector_field, w_size, axis=0)[::w_size//4, ...]
-        H = np.std(np.sum(window, axis=-1))
-        compl_vars_.append(H)
+    plot_entire_stat_tresh((vs_np.shape[1],vs_np.shape[2]), vs_np, us_np, thresh=0.5, flow_stats=flow_stats)
     
+    with profiler.stage("fluctuation", frames=len(vs_np)):
+        compl_vars_ = compute_fluctuations(vs_np, us_np, temporal_scales, precision=precision)
     
-    analyze_hs(hs=compl_vars_, 
-               S=np.array(temporal_scales), 
-               output_file=output_fluctuation_file,
-               plot=True,
-               title=f"H(S): {input_file}")
+    with profiler.stage("fit"):
+        cross, slope_l, slope_h = analyze_hs(hs=compl_vars_, 
+                                             S=np.array(temporal_scales), 
+                                             output_file=output_fluctuation_file,
+                                             plot=True,
+                                             title=f"H(S): {input_file}")
+
+    if tile_size is not None:
+        with profiler.stage("fluctuation_maps", frames=len(vs_np)):
+            maps = compute_fluctuation_maps(vs_np, us_np, temporal_scales, tile=tile_size, precision=precision)
+        np.savez(os.path.splitext(output_fluctuation_file)[0] + '_maps.npz', **maps)
+        plot_fluctuation_maps(maps, title=f"Fluctuation maps: {input_file}")
+
+    significance = {}
+    if n_surrogates:
+        with profiler.stage("surrogates", frames=len(vs_np)):
+            signal = aggregate_signal(vs_np, us_np, tile=surrogate_tile)
+            signal_hs = signal_fluctuations(signal, temporal_scales, precision=precision)
+            surrogate_hs = surrogate_fluctuations(signal, temporal_scales, n_surrogates, method=surrogate_method,
+                                                  precision=precision)
+            test = surrogate_test(signal_hs, temporal_scales, surrogate_hs)
+        np.savez(os.path.splitext(output_fluctuation_file)[0] + '_surrogates.npz', 
+                 hs=signal_hs, surrogate_hs=surrogate_hs, scales=np.asarray(temporal_scales), **test)
+        plot_surrogate_test(signal_hs, temporal_scales, test, title=f"H(S) vs surrogates: {input_file}")
+        # Проверяется H(S) усредненного сигнала, а не H(S) всего поля (crossover, slope_l, slope_h),
+        # поэтому оценки теста записываются вместе с их интервалами и p-значениями под отдельными именами
+        significance = {f"aggregate_{name}{suffix}": float(test[name + suffix]) if suffix != "_ci" 
+                                                      else np.asarray(test[name + suffix]).tolist()
+                        for name in ("crossover", "slope_l", "slope_h") for suffix in ("", "_p", "_ci")}
+
+    with profiler.stage("render", frames=len(vs_np) if animation_backend else 0):
+        make_animation(vs_np, us_np, output_animation_file, backend=animation_backend, workers=workers, 
+                       flow_stats=flow_stats)
+
+    return profiler.emit(metrics_file, 
+                         video=input_file, 
+                         frames=len(vs_np),
+                         crossover=int(temporal_scales[cross]), 
+                         slope_l=float(slope_l), 
+                         slope_h=float(slope_h),
+                         **significance)
+
+
+
+def load_jobs(source: str, cache_dir: str, output_dir: str, output_animation_file: str = None,
+              output_fluctuation_file: str = None):
+    """Функция формирует список заданий обработки видео.
+
+    Источник — видеофайл, каталог с видео или манифест заданий:
+    - `.txt` — путь к видео на каждой строке;
+    - `.json` — список путей или объектов с ключами `input_file` и, опционально, `cache_file`,
+      `output_animation_file`, `output_fluctuation_file`.
+    Относительные пути манифеста отсчитываются от его каталога.
+    Имена результатов по умолчанию совпадают с именем видео; если у нескольких видео из разных каталогов
+    одинаковые имена, к имени добавляется хэш полного пути. Задания, результаты которых записываются
+    в одни и те же файлы, отклоняются.
+
+    :param source: путь к видео, каталогу или манифесту
+    :param cache_dir: каталог кэша оптического потока
+    :param output_dir: каталог результатов
+    :param output_animation_file: путь сохранения анимации (только для одного видео)
+    :param output_fluctuation_file: путь сохранения флуктуационной характеристики (только для одного видео)
+    :return: список заданий (словари с путями input_file, cache_file, output_animation_file, output_fluctuation_file)
+    """
+
+    if os.path.isdir(source):
+        entries = [{"input_file": input_file} for input_file, *_ in sorted(bacterial_ds_generator(input_dir=source,
+                                                                                                  cache_dir=cache_dir,
+                                                                                                  output_dir=output_dir))]
+    elif not os.path.isfile(source):
+        raise ValueError(f"Invalid input {source}: choose a video file, a directory with video files or a manifest")
+    elif os.path.splitext(source)[1] in VIDEO_TYPES:
+        entries = [{"input_file": os.path.abspath(source),
+                    "output_animation_file": output_animation_file,
+                    "output_fluctuation_file": output_fluctuation_file}]
+    else:
+        entries = _read_manifest(source)
+
+    base_names = [os.path.splitext(os.path.basename(entry["input_file"]))[0] for entry in entries]
+    jobs = []
+    for entry, file_name in zip(entries, base_names):
+        if base_names.count(file_name) > 1:
+            path_hash = hashlib.sha256(os.path.abspath(entry["input_file"]).encode()).hexdigest()[:8]
+            file_name = f"{file_name}_{path_hash}"
+        jobs.append({"input_file": entry["input_file"],
+                     "cache_file": entry.get("cache_file") or os.path.join(cache_dir, file_name + '.npz'),
+                     "output_animation_file": entry.get("output_animation_file") or os.path.join(output_dir, file_name + '.mp4'),
+                     "output_fluctuation_file": entry.get("output_fluctuation_file") or os.path.join(output_dir, file_name + '.csv')})
 
-    make_animation(vs_np, us_np, output_animation_file)
+    for key in ("output_animation_file", "output_fluctuation_file"):
+        paths = [os.path.abspath(job[key]) for job in jobs]
+        duplicates = sorted({path for path in paths if paths.count(path) > 1})
+        if duplicates:
+            raise ValueError(f"Several jobs write to the same file: {', '.join(duplicates)}")
+    return jobs
+
+
+def _read_manifest(source: str) -> list:
+    manifest_dir = os.path.dirname(os.path.abspath(source))
+    resolve = lambda path: path if path is None else os.path.join(manifest_dir, path)
+    ext = os.path.splitext(source)[1]
+    with open(source) as f:
+        if ext == '.json':
+            entries = json.load(f)
+        elif ext == '.txt':
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        else:
+            raise ValueError(f"Unsupported input {source}. Supported: video ({', '.join(VIDEO_TYPES)}), "
+                             f"directory, manifest (.txt, .json)")
+    if not isinstance(entries, list):
+        raise ValueError(f"Manifest {source} must contain a list of jobs")
+    entries = [{"input_file": entry} if isinstance(entry, str) else entry for entry in entries]
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or not isinstance(entry.get("input_file"), str):
+            raise ValueError(f"Job {number} in manifest {source} has no input_file: {entry!r}")
+    return [{key: resolve(entry.get(key)) for key in ("input_file",
+                                                      "cache_file",
+                                                      "output_animation_file",
+                                                      "output_fluctuation_file")} for entry in entries]
+
+
+def params_digest(params: dict) -> str:
+    """Функция вычисляет хэш параметров, влияющих на результаты обработки (`RESULT_PARAMS`).
+    """
+
+    payload = json.dumps({key: params.get(key) for key in RESULT_PARAMS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _job_state_file(job: dict) -> str:
+    return os.path.splitext(job["output_fluctuation_file"])[0] + '.done.json'
+
+
+def _video_stamp(input_file: str) -> dict:
+    stat = os.stat(input_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def job_is_up_to_date(job: dict, digest: str, animation_backend: str = "matplotlib", tile_size: int = None,
+                      n_surrogates: int = 0):
+    """Функция проверяет, актуальны ли результаты задания: сохранено состояние успешной обработки
+    для того же видео (размер, время изменения) и тех же параметров, а файлы результатов существуют.
+    Оптический поток при повторной обработке берется из кэша, ключ которого учитывает содержимое
+    видео и параметры потока.
+
+    :param job: задание (см. `load_jobs`)
+    :param digest: хэш параметров (см. `params_digest`)
+    :param animation_backend: способ отрисовки анимации (None — анимация не требуется)
+    :param tile_size: размер блока карт (None — карты <имя>_maps.npz не требуются)
+    :param n_surrogates: количество суррогатов (0 — файл <имя>_surrogates.npz не требуется)
+    :return: сохраненная запись метрик, если результаты актуальны, иначе None
+    """
+
+    outputs = [job["output_fluctuation_file"]]
+    if animation_backend is not None:
+        outputs.append(job["output_animation_file"])
+    if tile_size is not None:
+        outputs.append(os.path.splitext(job["output_fluctuation_file"])[0] + '_maps.npz')
+    if n_surrogates:
+        outputs.append(os.path.splitext(job["output_fluctuation_file"])[0] + '_surrogates.npz')
+    try:
+        with open(_job_state_file(job)) as f:
+            state = json.load(f)
+        if state["video"] != _video_stamp(job["input_file"]) or state["params"] != digest:
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    if not all(os.path.exists(path) for path in outputs):
+        return None
+    return state["record"]
+
+
+def _init_batch_worker(progress: bool):
+    # Графики в пакетном режиме не показываются
+    plt.switch_backend("Agg")
+    set_progress(progress)
+
+
+def _run_job(job: dict, digest: str, process_kwargs: dict) -> dict:
+    """Функция обрабатывает одно видео в процессе пула; ошибка не прерывает пакет, а возвращается
+    в записи результата.
+    """
+
+    try:
+        for path in (job["cache_file"], job["output_animation_file"], job["output_fluctuation_file"]):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        record = video_process(**job, **process_kwargs)
+    except Exception:
+        return {"video": job["input_file"], "status": "failed", "error": traceback.format_exc()}
+    finally:
+        plt.close('all')
+    with open(_job_state_file(job), 'w') as f:
+        json.dump({"video": _video_stamp(job["input_file"]), "params": digest, "record": record}, f, default=str)
+    return {**record, "status": "done"}
+
+
+def write_summary(results: list, summary_file: str):
+    """Функция записывает сводную таблицу (CSV) результатов пакетной обработки: перекрест и наклоны
+    для каждого видео, статус и время обработки.
+
+    :param results: список записей результатов (см. `run_batch`)
+    :param summary_file: путь к файлу сводной таблицы
+    """
+
+    with open(summary_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            error = result.get("error")
+            writer.writerow({**result, "error": error.strip().splitlines()[-1] if error else None})
+
+
+def run_batch(jobs: list, params: dict, batch_workers: int = 1, force: bool = False, summary_file: str = None):
+    """Функция пакетной обработки видео в пуле процессов.
+    - Пропуск видео с актуальными результатами (см. `job_is_up_to_date`)
+    - Обработка остальных видео в пуле из `batch_workers` процессов
+    - Журналирование ошибок без прерывания пакета
+    - Сохранение сводной таблицы
+
+    :param jobs: список заданий (см. `load_jobs`)
+    :param params: параметры запуска (params.json)
+    :param batch_workers: количество одновременно обрабатываемых видео
+    :param force: обработать все видео, даже если результаты актуальны
+    :param summary_file: путь к сводной таблице (CSV); None — таблица не сохраняется
+    :return: список записей результатов в порядке заданий
+    """
+
+    animation_backend = params.get('animation_backend', 'matplotlib')
+    record_duration = params['record_duration']
+    process_kwargs = dict(temporal_scales=compute_temporal_scales(params['base'], params['smin'], record_duration/2),
+                          workers=params.get('workers'),
+                          cache_max_bytes=params.get('cache_max_bytes'),
+                          animation_backend=animation_backend,
+                          metrics_file=params.get('metrics_file'),
+                          engine=FlowEngine.from_params(params),
+                          frame_count=record_duration,
+                          tile_size=params.get('tile_size'),
+                          storage=params.get('flow_storage', 'float32'),
+                          precision=params.get('precision', 'double'),
+                          n_surrogates=params.get('n_surrogates', 0),
+                          surrogate_method=params.get('surrogate_method', 'shuffle'),
+                          surrogate_tile=params.get('surrogate_tile'))
+    digest = params_digest(params)
+
+    results = {}
+    pending = []
+    for index, job in enumerate(jobs):
+        record = None if force else job_is_up_to_date(job, digest, animation_backend, 
+                                                      tile_size=process_kwargs["tile_size"], 
+                                                      n_surrogates=process_kwargs["n_surrogates"])
+        if record is not None:
+            logger.info('Skip up-to-date video %s', job["input_file"])
+            results[index] = {**record, "status": "skipped"}
+        else:
+            pending.append(index)
+
+    logger.info('Process %d of %d videos with %d workers', len(pending), len(jobs), batch_workers)
+    with ProcessPoolExecutor(max_workers=batch_workers,
+                             initializer=_init_batch_worker,
+                             initargs=(params.get('progress', batch_workers == 1),)) as executor:
+        futures = {executor.submit(_run_job, jobs[index], digest, process_kwargs): index for index in pending}
+        for future in as_completed(futures):
+            index = futures[future]
+            input_file = jobs[index]["input_file"]
+            try:
+                result = future.result()
+            except Exception:
+                # Аварийное завершение процесса-исполнителя
+                result = {"video": input_file, "status": "failed", "error": traceback.format_exc()}
+            if result["status"] == "failed":
+                logger.error('Failed to process %s\n%s', input_file, result["error"])
+            else:
+                logger.info('Done %s: crossover %s, slopes %.3f / %.3f',
+                            input_file, result["crossover"], result["slope_l"], result["slope_h"])
+            results[index] = result
+
+    results = [results[index] for index in range(len(jobs))]
+    if summary_file is not None:
+        write_summary(results, summary_file)
+    failed = sum(result["status"] == "failed" for result in results)
+    logger.info('Batch finished: %d videos, %d failed', len(results), failed)
+    return results
+
+
+def online_process(source, params: dict):
+    """Функция онлайн-анализа живого источника или воспроизводимого видео (см. `utils.online.monitor`).
+    Результаты (H(S), перекрест, наклоны, задержка обработки кадра) выводятся строками JSON 
+    в params['metrics_file'] или stdout каждые params['online_emit_every'] кадров.
+
+    :param source: путь к видео, адрес потока или номер камеры
+    :param params: параметры запуска (params.json)
+    :return: результат на последнем кадре
+    """
+
+    metrics_file = params.get('metrics_file')
+
+    def emit(result):
+        line = json.dumps({"source": str(source), **result})
+        if metrics_file is None:
+            print(line)
+        else:
+            with open(metrics_file, 'a') as f:
+                f.write(line + "\n")
+
+    return monitor(int(source) if str(source).isdigit() else source,
+                   compute_temporal_scales(params['base'], params['smin'], params['record_duration']/2),
+                   engine=FlowEngine.from_params(params),
+                   fps=params.get('online_fps'),
+                   emit_every=params.get('online_emit_every', 25),
+                   horizon=params.get('online_horizon'),
+                   precision=params.get('precision', 'double'),
+                   callback=emit)
 
 
 if __name__ == '__main__':
@@ -61,61 +423,47 @@ if __name__ == '__main__':
     output_path = project_path + 'data/output/'
     cache_path = project_path + 'data/cache/'
 
-    with open('params.json') as f:
+    # main.py [-p params.json] [-i видео|каталог|манифест] [-j количество процессов] [-f] [-o]
+    # -o — онлайн-режим: -i видео, адрес потока или номер камеры
+    opts, _ = getopt.getopt(argv[1:], 'p:i:j:fo', ['params=', 'input=', 'jobs=', 'force', 'online'])
+    opts = dict(opts)
+    params_file = opts.get('-p', opts.get('--params', 'params.json'))
+
+    with open(params_file) as f:
         params = json.load(f)
-    
-    input_type_bool = None
-    if os.path.isfile(params['input']):
-        input_type_bool = True
-        input_file = os.path.abspath(params['input'])
-        path_file, ext = os.path.splitext(input_file)
-        file_name = os.path.basename(path_file) 
-        file_types = ['.avi', '.mp4']
-        if ext not in file_types:
-            print('The video format is incorrect. Supported:', *file_types)
-            sys.exit()
-    elif os.path.isdir(params['input']):
-        input_type_bool = False
-        input_dir = os.path.abspath(params['input']) + '/'
-    else:
-        print('Invalid input type. Chose video file or path with video files')
+
+    source = opts.get('-i', opts.get('--input', params.get('input')))
+    if source is None:
+        print(f"No input: pass -i or set input in {params_file}")
         sys.exit()
-        
-    output_animation_file = params['output_animation']
-    
-    if output_animation_file is None:
-        if input_type_bool:
-            output_animation_file = output_path + file_name + '.mp4'
-    
-    output_fluctuation_file = params['output_fluctuation_characteristic_file']
-    if output_fluctuation_file is None:
-        if input_type_bool:
-            output_fluctuation_file = output_path + file_name + '.csv'
-
-    base = params['base']
-    smin = params['smin']
-    smax = params['record_duration']/2
-
-    temporal_scales = compute_temporal_scales(base, smin, smax)
-
-    if input_type_bool:
-        print('Start video processing', file_name)
-        cache_file = cache_path + file_name + '.npz'
-        video_process(input_file=input_file, 
-                      cache_file=cache_file, 
-                      output_animation_file=output_animation_file, 
-                      output_fluctuation_file=output_fluctuation_file, 
-                      temporal_scales=temporal_scales)
-    else: 
-        print('Start dir processing')
-        for input_file, \
-            cache_file, \
-            output_animation_file, \
-            output_fluctuation_file in bacterial_ds_generator(input_dir=input_dir, 
-                                                              cache_dir=cache_path, 
-                                                              output_dir=output_path):
-            video_process(input_file=input_file,
-                          cache_file=cache_file, 
-                          output_animation_file=output_animation_file, 
-                          output_fluctuation_file= output_fluctuation_file,
-                          temporal_scales=temporal_scales)
\ No newline at end of file
+    batch_workers = int(opts.get('-j', opts.get('--jobs', params.get('batch_workers', 1))))
+    force = '-f' in opts or '--force' in opts
+
+    if '-o' in opts or '--online' in opts:
+        set_progress(False)
+        online_process(source, params)
+        sys.exit()
+
+    os.makedirs(output_path, exist_ok=True)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s',
+                        handlers=[logging.StreamHandler(),
+                                  logging.FileHandler(params.get('log_file') or output_path + 'batch.log')])
+    set_progress(params.get('progress', True))
+
+    try:
+        jobs = load_jobs(source,
+                         cache_dir=cache_path,
+                         output_dir=output_path,
+                         output_animation_file=params.get('output_animation'),
+                         output_fluctuation_file=params.get('output_fluctuation_characteristic_file'))
+    except ValueError as e:
+        print(e)
+        sys.exit()
+
+    print('Start processing', len(jobs), 'videos')
+    run_batch(jobs,
+              params,
+              batch_workers=batch_workers,
+              force=force,
+              summary_file=params.get('summary_file') or output_path + 'summary.csv')
@@ -0,0 +1,217 @@
+"""Бенчмарк этапов конвейера на синтетических данных.
+
+Генерирует синтетическое видео (и стек в формате сцены ZVI) заданного размера и длительности и измеряет
+для каждого этапа — чтение кадров, оптический поток, флуктуационный анализ, анализ H(S) (`analyze_hs`)
+и отрисовку анимации — время, кадры в секунду и пиковое потребление памяти (RSS). Этапы вызывают те же
+функции с теми же параметрами по умолчанию, что и `video_process` (отрисовка — matplotlib).
+Микробенчмарки (`MICRO_STAGES`, поле "micro" в результатах) измеряют отдельные функции вне конвейера,
+например пакетный поиск перекреста для `--curves` кривых. Каждый этап выполняется в отдельном процессе,
+поэтому пиковая память относится к одному этапу. Результаты сохраняются в JSON.
+
+Пример:
+    python bench_pipeline.py --frames 300 --height 512 --width 512 --output bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+RESEARCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+sys.path.append(RESEARCH_DIR)
+from utils.profiling import max_rss_mb
+
+STAGES = ["decode_video", "decode_zvi", "flow", "fluctuation", "fit", "render"]
+MICRO_STAGES = ["crossover_batch"]
+
+
+def _stage_decode_video(config):
+    from utils.data_generator import frame_generator
+    n = 0
+    for _ in frame_generator(config["video"], blur_sigma=1, frame_count=config["frames"], copy=False):
+        n += 1
+    return n
+
+
+def _stage_decode_zvi(config):
+    import numpy as np
+    from utils.data_generator import scene_frame_generator
+    from utils.synthetic import SyntheticScene
+    scene = SyntheticScene(np.load(config["stack"], mmap_mode='r'))
+    n = 0
+    for _ in scene_frame_generator(scene, blur_sigma=1, frame_count=config["frames"]):
+        n += 1
+    return n
+
+
+def _stage_flow(config):
+    import numpy as np
+    from utils.data_generator import frame_generator
+    from utils.optical_flow import compute_optical_flow, compute_optical_flow_parallel
+    if config["workers"]:
+        vs_np, us_np = compute_optical_flow_parallel(config["video"], blur_sigma=1, frame_count=config["frames"],
+                                                     workers=config["workers"])
+    else:
+        vs_np, us_np = compute_optical_flow(frame_generator(config["video"], blur_sigma=1,
+                                                            frame_count=config["frames"], copy=False),
+                                            gen_length=config["frames"])
+    np.save(config["vs"], vs_np)
+    np.save(config["us"], us_np)
+    return len(vs_np) + 1
+
+
+def _stage_fluctuation(config):
+    import numpy as np
+    from utils.fluctuation import compute_fluctuations
+    from utils.stats import compute_temporal_scales
+    vs_np = np.load(config["vs"], mmap_mode='r')
+    us_np = np.load(config["us"], mmap_mode='r')
+    temporal_scales = compute_temporal_scales(config["base"], config["smin"], config["frames"] / 2)
+    hs = compute_fluctuations(vs_np, us_np, temporal_scales)
+    np.save(config["hs"], np.stack([np.array(temporal_scales, dtype=np.float64), hs]))
+    return len(vs_np)
+
+
+def _stage_fit(config):
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    from utils.stats import analyze_hs
+    S, hs = np.load(config["hs"])
+    analyze_hs(hs, S, config["fluctuation"], plot=True)
+    return 1
+
+
+def _stage_crossover_batch(config):
+    import numpy as np
+    from utils.stats import fit_crossover
+    S, hs = np.load(config["hs"])
+    rng = np.random.default_rng(0)
+    curves = hs * np.exp(rng.normal(0, 0.05, size=(config["curves"], len(S))))
+    fit_crossover(curves, S)
+    return config["curves"]
+
+
+def _stage_render(config):
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    from utils.stats import make_animation
+    vs_np = np.load(config["vs"], mmap_mode='r')
+    us_np = np.load(config["us"], mmap_mode='r')
+    make_animation(vs_np, us_np, config["animation"], backend=config["render_backend"],
+                   workers=config["workers"])
+    return len(vs_np)
+
+
+def _run_stage(name, config):
+    # Импорт модулей вне измеряемого интервала
+    import utils.data_generator, utils.fluctuation, utils.optical_flow, utils.stats
+    baseline = max_rss_mb()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    items = globals()[f"_stage_{name}"](config)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    return {"stage": name,
+            "micro": name in MICRO_STAGES,
+            "items": items,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "items_per_s": items / wall if wall > 0 else None,
+            "baseline_rss_mb": baseline,
+            "peak_rss_mb": max_rss_mb()}
+
+
+def prepare_inputs(config):
+    """
+    Функция создает синтетические входные данные в рабочем каталоге.
+    """
+
+    import numpy as np
+    from utils.synthetic import synthetic_motion_frames, write_synthetic_video
+
+    frames = synthetic_motion_frames(config["frames"], config["height"], config["width"], seed=config["seed"])
+    write_synthetic_video(config["video"], frames)
+    del frames
+    stack = synthetic_motion_frames(config["frames"], config["height"], config["width"],
+                                    dtype=np.uint16, seed=config["seed"] + 1)
+    np.save(config["stack"], stack)
+
+
+def run_benchmarks(config, stages=STAGES):
+    """
+    Функция выполняет этапы бенчмарка, каждый в отдельном процессе.
+
+    :param config: dict, параметры бенчмарка (см. `main`).
+    :param stages: list, список этапов.
+    :return: dict, результаты с описанием окружения.
+    """
+
+    import cv2
+    import numpy as np
+
+    prepare_inputs(config)
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in stages:
+        with context.Pool(1) as pool:
+            result = pool.apply(_run_stage, (name, config))
+        print(f"{name:16s} {result['wall_s']:8.3f} s {result['items_per_s'] or 0:10.1f} items/s "
+              f"{result['peak_rss_mb']:8.1f} MB")
+        results.append(result)
+    return {"config": config,
+            "environment": {"python": platform.python_version(),
+                            "platform": platform.platform(),
+                            "cpu_count": os.cpu_count(),
+                            "numpy": np.__version__,
+                            "opencv": cv2.__version__},
+            "stages": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--curves", type=int, default=1000)
+    parser.add_argument("--base", type=float, default=1.1)
+    parser.add_argument("--smin", type=int, default=8)
+    parser.add_argument("--render-backend", default="matplotlib")
+    parser.add_argument("--stages", nargs="+", default=STAGES + MICRO_STAGES, choices=STAGES + MICRO_STAGES)
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--output", default="bench.json")
+    args = parser.parse_args(argv)
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="tcw_bench_"))
+    os.makedirs(workdir, exist_ok=True)
+    config = {"frames": args.frames,
+              "height": args.height,
+              "width": args.width,
+              "seed": args.seed,
+              "workers": args.workers,
+              "curves": args.curves,
+              "base": args.base,
+              "smin": args.smin,
+              "render_backend": args.render_backend,
+              "workdir": workdir,
+              "video": os.path.join(workdir, "synthetic.avi"),
+              "stack": os.path.join(workdir, "synthetic_stack.npy"),
+              "vs": os.path.join(workdir, "vs.npy"),
+              "us": os.path.join(workdir, "us.npy"),
+              "hs": os.path.join(workdir, "hs.npy"),
+              "fluctuation": os.path.join(workdir, "fluctuation.csv"),
+              "animation": os.path.join(workdir, "animation.mp4")}
+
+    report = run_benchmarks(config, args.stages)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Отчет о влиянии точности хранения и вычислений на результаты флуктуационного анализа.
+
+Оптический поток видео (или синтетического видео) вычисляется один раз в float32; затем для каждого
+формата хранения кэша (float32, float16, int16 с масштабом) и каждой точности вычислений (double —
+complex128, single — complex64) вычисляются H(S), перекрест и наклоны режимов (и, при --tile, карты
+по блокам) и сравниваются с эталоном float32/double. Результаты сохраняются в JSON.
+
+Пример:
+    python precision_report.py --video vid_3.mp4 --frames 300 --output precision.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+RESEARCH_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+sys.path.append(RESEARCH_DIR)
+
+STORAGES = ["float32", "float16", "int16"]
+PRECISIONS = ["double", "single"]
+
+
+def _analyze(vs_np, us_np, temporal_scales, precision, tile):
+    import numpy as np
+    from utils.fluctuation import compute_fluctuations, compute_fluctuation_maps
+    from utils.stats import fit_crossover
+
+    wall = time.perf_counter()
+    hs = compute_fluctuations(vs_np, us_np, temporal_scales, precision=precision)
+    cross, slope_l, slope_h, _ = fit_crossover(hs, np.array(temporal_scales))
+    result = {"hs": hs,
+              "crossover": int(temporal_scales[cross]),
+              "slope_l": float(slope_l),
+              "slope_h": float(slope_h),
+              "wall_s": time.perf_counter() - wall}
+    if tile:
+        result["maps"] = compute_fluctuation_maps(vs_np, us_np, temporal_scales, tile=tile, precision=precision)
+    return result
+
+
+def _compare(result, reference):
+    import numpy as np
+
+    row = {"hs_max_rel_err": float(np.nanmax(np.abs(result["hs"] / reference["hs"] - 1))),
+           "crossover": result["crossover"],
+           "crossover_diff": result["crossover"] - reference["crossover"],
+           "slope_l": result["slope_l"],
+           "slope_l_diff": result["slope_l"] - reference["slope_l"],
+           "slope_h": result["slope_h"],
+           "slope_h_diff": result["slope_h"] - reference["slope_h"],
+           "wall_s": result["wall_s"]}
+    if "maps" in result:
+        maps, ref_maps = result["maps"], reference["maps"]
+        valid = np.isfinite(maps["crossover"]) & np.isfinite(ref_maps["crossover"])
+        row.update(tiles_crossover_changed=float(np.mean(maps["crossover"][valid] != ref_maps["crossover"][valid])),
+                   tiles_slope_l_max_diff=float(np.nanmax(np.abs(maps["slope_l"] - ref_maps["slope_l"]))),
+                   tiles_slope_h_max_diff=float(np.nanmax(np.abs(maps["slope_h"] - ref_maps["slope_h"]))))
+    return row
+
+
+def precision_report(vs_np, us_np, temporal_scales, storages=STORAGES, precisions=PRECISIONS, tile=None):
+    """
+    Функция сравнивает результаты анализа для всех сочетаний формата хранения и точности вычислений
+    с эталоном (float32, double).
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты потока (float32).
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты потока (float32).
+    :param temporal_scales: list, временные масштабы.
+    :param storages: list, форматы хранения (см. `utils.flow_cache.STORAGE_DTYPES`).
+    :param precisions: list, точности вычислений (см. `utils.fluctuation.PRECISIONS`).
+    :param tile: int, опционально: размер блока для сравнения карт.
+    :return: list, строки отчета.
+    """
+
+    import numpy as np
+    from utils.flow_cache import QuantizedArray, quantize
+
+    reference = _analyze(vs_np, us_np, temporal_scales, "double", tile)
+    rows = []
+    for storage in storages:
+        vs_q, vs_scale = quantize(vs_np, storage)
+        us_q, us_scale = quantize(us_np, storage)
+        vs_d, us_d = QuantizedArray(vs_q, vs_scale), QuantizedArray(us_q, us_scale)
+        for precision in precisions:
+            row = {"storage": storage,
+                   "precision": precision,
+                   "flow_bytes": int(vs_q.nbytes + us_q.nbytes),
+                   "flow_bytes_ratio": (vs_q.nbytes + us_q.nbytes) / (vs_np.nbytes + us_np.nbytes),
+                   "cumsum_itemsize": np.dtype(np.complex128 if precision == "double" else np.complex64).itemsize}
+            row.update(_compare(_analyze(vs_d, us_d, temporal_scales, precision, tile), reference))
+            rows.append(row)
+            print(f"{storage:8s} {precision:7s} bytes x{row['flow_bytes_ratio']:.2f} "
+                  f"H(S) err {row['hs_max_rel_err']:.2e} crossover {row['crossover']} ({row['crossover_diff']:+d}) "
+                  f"slopes {row['slope_l']:.4f} ({row['slope_l_diff']:+.1e}) "
+                  f"{row['slope_h']:.4f} ({row['slope_h_diff']:+.1e})")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default=None, help="видеофайл (по умолчанию синтетическое видео)")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--height", type=int, default=256)
+    parser.add_argument("--width", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base", type=float, default=1.1)
+    parser.add_argument("--smin", type=int, default=8)
+    parser.add_argument("--tile", type=int, default=None)
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--output", default="precision.json")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    video = None if args.video is None else os.path.abspath(args.video)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="tcw_precision_"))
+    os.makedirs(workdir, exist_ok=True)
+
+    from utils.data_generator import frame_generator
+    from utils.optical_flow import compute_optical_flow
+    from utils.stats import compute_temporal_scales
+    from utils.synthetic import synthetic_motion_frames, write_synthetic_video
+
+    if video is None:
+        video = os.path.join(workdir, "synthetic.avi")
+        write_synthetic_video(video, synthetic_motion_frames(args.frames, args.height, args.width, seed=args.seed))
+    vs_np, us_np = compute_optical_flow(frame_generator(video, blur_sigma=1, frame_count=args.frames, copy=False),
+                                        gen_length=args.frames)
+    temporal_scales = compute_temporal_scales(args.base, args.smin, args.frames / 2)
+
+    rows = precision_report(vs_np, us_np, temporal_scales, tile=args.tile)
+    with open(output, "w") as f:
+        json.dump({"video": video,
+                   "frames": len(vs_np),
+                   "shape": list(vs_np.shape[1:]),
+                   "temporal_scales": [int(s) for s in temporal_scales],
+                   "tile": args.tile,
+                   "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
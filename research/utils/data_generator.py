@@ -4,6 +4,9 @@ from glob import glob
 import os
 import slideio
 import numpy as np
+import queue
+import threading
+import time
 
 
 def bacterial_ds_generator(input_dir, cache_dir, output_dir):
@@ -25,23 +28,127 @@ def bacterial_ds_generator(input_dir, cache_dir, output_dir):
         fluctuation_file = os.path.join(output_dir, file_name+".csv")
         yield input_file, cache_file, output_file, fluctuation_file
 
-def zvi_based_frame_generator(video_path, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max):
+def video_length(video_path):
+    """
+    Функция возвращает количество кадров видеофайла (по заголовку контейнера) или стека ZVI.
+
+    :param video_path: str, путь к видеофайлу.
+    :return: int, количество кадров.
+    """
+
+    if video_path.endswith("zvi"):
+        return slideio.open_slide(video_path, "ZVI").get_scene(0).num_t_frames
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    finally:
+        cap.release()
+
+def _read_zvi_frames(scene, frame_ids, step):
+    """
+    Функция читает кадры `frame_ids` из сцены ZVI одним вызовом `read_block` для диапазона
+    [frame_ids[0], frame_ids[-1] + 1) с последующим прореживанием с шагом `step`.
+
+    :return: np.array, массив кадров формы (n, H, W).
+    """
+
+    block = scene.read_block(rect=(0,0,0,0), size=(0,0), channel_indices=[0], slices=(0,1), 
+                             frames=(frame_ids[0], frame_ids[-1] + 1))
+    if block.ndim == 2:
+        block = block[None]
+    return block[::step]
+
+def _zvi_batches(scene, frame_ids, step, blur_sigma, read_size):
+    for begin in range(0, len(frame_ids), read_size):
+        batch = _read_zvi_frames(scene, frame_ids[begin:begin + read_size], step)
+        if blur_sigma is not None:
+            batch = gaussian_filter(batch, sigma=(0, blur_sigma, blur_sigma))
+        yield batch
+
+def _prefetch(iterable, depth=1):
+    """
+    Функция выполняет итерацию по `iterable` в фоновом потоке, опережая потребителя на `depth` элементов.
+    """
+
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def worker():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            items.put(end)
+        except BaseException as e:
+            items.put(e)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def zvi_based_frame_generator(video_path, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max,
+                              read_size=32, batch_size=None, prefetch=True):
     """
     Функция генерирует кадры изображений из файла формата ZVI.
 
+    Кадры читаются диапазонами по оси T (один вызов `read_block` на `read_size` выдаваемых кадров,
+    т.е. на `read_size * step` кадров стека),
+    параметры `start_frame`, `step`, `blur_sigma` и `frame_count` трактуются так же, как для видео,
+    чтение прекращается в конце стека. При `prefetch=True` следующий пакет читается в фоновом потоке,
+    пока обрабатывается текущий.
+
     :param video_path: str, путь к файлу ZVI.
     :param start_frame: int, опциональный параметр, номер первого кадра для чтения.
     :param step: int, опциональный параметр, шаг между кадрами для чтения.
     :param blur_sigma: float, опциональный параметр, стандартное отклонение для размытия изображения (если требуется).
-    :param frame_count: int, опциональный параметр, максимальное количество кадров для чтения.
+    :param frame_count: int, опциональный параметр, номер кадра, до которого выполняется чтение.
+    :param read_size: int, опциональный параметр, количество кадров в одном чтении (по умолчанию 32).
+    :param batch_size: int, опциональный параметр, если задан — выдаются пакеты формы (n, H, W) 
+            по `batch_size` кадров вместо отдельных кадров.
+    :param prefetch: bool, опциональный параметр, упреждающее чтение следующего пакета (по умолчанию True).
     :return: generator, генератор кадров изображений из файла ZVI.
     """
 
     slide = slideio.open_slide(video_path,"ZVI")
-    scene = slide.get_scene(0)
-    for frame_i in range(0, frame_count):
-        i = frame_i % scene.num_t_frames
-        yield scene.read_block(rect=(0,0,0,0), size=(0,0), channel_indices=[0], slices=(0,1), frames=(i,i+1))
+    yield from scene_frame_generator(slide.get_scene(0), start_frame, step, blur_sigma, frame_count,
+                                     read_size, batch_size, prefetch)
+
+def scene_frame_generator(scene, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max,
+                          read_size=32, batch_size=None, prefetch=True):
+    """
+    Функция генерирует кадры из сцены с интерфейсом `slideio.Scene` (`num_t_frames`, `read_block`).
+    Параметры совпадают с `zvi_based_frame_generator`.
+
+    :param scene: сцена slideio (или объект с тем же интерфейсом).
+    :return: generator, генератор кадров (или пакетов кадров) сцены.
+    """
+
+    frame_ids = range(start_frame, min(frame_count, scene.num_t_frames), step)
+    batches = _zvi_batches(scene, frame_ids, step, blur_sigma, batch_size or read_size)
+    if prefetch:
+        batches = _prefetch(batches)
+    for batch in batches:
+        if batch_size is not None:
+            yield batch
+        else:
+            yield from batch
 
 
 def video_based_frame_generator(video_path, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max):
@@ -79,18 +186,168 @@ def video_based_frame_generator(video_path, start_frame=0, step=1, blur_sigma=No
         yield grey_np
     cap.release()
 
-def frame_generator(video_path:str, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max):
+def live_frame_generator(source, fps=None, blur_sigma=None, frame_count=np.iinfo(int).max):
+    """
+    Функция генерирует кадры из живого источника (камера, сетевой поток) или воспроизводит видеофайл 
+    с фиксированной частотой кадров для проверки онлайн-режима. Кадры читаются последовательно, 
+    без позиционирования.
+
+    :param source: str или int, путь к видеофайлу, адрес потока или номер камеры.
+    :param fps: float, опциональный параметр, частота выдачи кадров (None — без ограничения, как позволяет источник).
+    :param blur_sigma: float, опциональный параметр, стандартное отклонение для размытия изображения (если требуется).
+    :param frame_count: int, опциональный параметр, максимальное количество кадров для чтения.
+    :return: generator, генератор кадров.
+    """
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print("Cannot open camera")
+        return
+    try:
+        start = time.monotonic()
+        for count in range(frame_count):
+            if fps is not None:
+                # Кадры выдаются по расписанию: отставание не накапливается задержками
+                delay = start + count / fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            grey_np = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if blur_sigma is not None:
+                grey_np = gaussian_filter(grey_np, sigma=blur_sigma)
+            yield grey_np
+    finally:
+        cap.release()
+
+def _video_reader_worker(cap, start_frame, step, blur_sigma, frame_count, batch_size,
+                         buffer_size, state, free_slots, filled_slots, stop):
+    """
+    Фоновый поток чтения видео: последовательное декодирование, перевод в оттенки серого и размытие
+    в заранее выделенный кольцевой буфер.
+    """
+
+    try:
+        count = start_frame
+        if count > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, count)
+        grey_np = None
+        finished = False
+        while not finished:
+            slot = None
+            while slot is None:
+                if stop.is_set():
+                    return
+                try:
+                    slot = free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            n = 0
+            while n < batch_size:
+                if count >= frame_count:
+                    finished = True
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    finished = True
+                    break
+                grey_np = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=grey_np)
+                if state.get('buffer') is None:
+                    state['buffer'] = np.empty((buffer_size, batch_size) + grey_np.shape, dtype=grey_np.dtype)
+                if blur_sigma is not None:
+                    gaussian_filter(grey_np, sigma=blur_sigma, output=state['buffer'][slot, n])
+                else:
+                    state['buffer'][slot, n] = grey_np
+                n += 1
+                count += step
+                if count < frame_count:
+                    for _ in range(step - 1):
+                        if not cap.grab():
+                            break
+            if n > 0:
+                filled_slots.put((slot, n))
+        filled_slots.put(None)
+    except BaseException as e:
+        filled_slots.put(e)
+    finally:
+        cap.release()
+
+def fast_video_frame_generator(video_path, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max,
+                               buffer_size=8, batch_size=None, copy=False):
+    """
+    Функция генерирует кадры видео из файлового источника с упреждающим чтением в фоновом потоке.
+
+    Видео декодируется последовательно (одно позиционирование на `start_frame`, пропуск кадров через
+    `grab()`), перевод в оттенки серого и размытие выполняются в фоновом потоке. Кадры выдаются из
+    заранее выделенного кольцевого буфера: выданный кадр (пакет) остается валидным до получения
+    следующего после него кадра (пакета), т.е. одновременно доступны текущий и предыдущий кадры.
+    Для долгого хранения кадры нужно копировать (`copy=True`).
+
+    :param video_path: str, путь к видеофайлу.
+    :param start_frame: int, опциональный параметр, номер первого кадра для чтения.
+    :param step: int, опциональный параметр, шаг между кадрами для чтения.
+    :param blur_sigma: float, опциональный параметр, стандартное отклонение для размытия изображения (если требуется).
+    :param frame_count: int, опциональный параметр, номер кадра, до которого выполняется чтение.
+    :param buffer_size: int, опциональный параметр, количество ячеек кольцевого буфера (не меньше 3).
+    :param batch_size: int, опциональный параметр, если задан — выдаются пакеты формы (n, H, W) вместо кадров.
+    :param copy: bool, опциональный параметр, выдавать копии кадров вместо представлений буфера (по умолчанию False).
+    :return: generator, генератор кадров (или пакетов кадров) из видео.
+    """
+
+    cap = cv2.VideoCapture(video_path) 
+    if not cap.isOpened():
+        print("Cannot open camera")
+        return
+
+    buffer_size = max(buffer_size, 3)
+    free_slots = queue.Queue()
+    filled_slots = queue.Queue()
+    for slot in range(buffer_size):
+        free_slots.put(slot)
+    state = {'buffer': None}
+    stop = threading.Event()
+    worker = threading.Thread(target=_video_reader_worker,
+                              args=(cap, start_frame, step, blur_sigma, frame_count, batch_size or 1,
+                                    buffer_size, state, free_slots, filled_slots, stop),
+                              daemon=True)
+    worker.start()
+
+    held_slots = []
+    try:
+        while True:
+            item = filled_slots.get()
+            if item is None:
+                print("Can't receive frame (stream end?). Exiting ...")
+                break
+            if isinstance(item, BaseException):
+                raise item
+            slot, n = item
+            held_slots.append(slot)
+            if len(held_slots) > 2:
+                free_slots.put(held_slots.pop(0))
+            frames = state['buffer'][slot, 0] if batch_size is None else state['buffer'][slot, :n]
+            yield frames.copy() if copy else frames
+    finally:
+        stop.set()
+        worker.join()
+
+def frame_generator(video_path:str, start_frame=0, step=1, blur_sigma=None, frame_count=np.iinfo(int).max,
+                    copy=True):
     """
     Функция определяет тип видеофайла и вызывает соответствующий генератор кадров.
+    Видеофайлы читаются `fast_video_frame_generator`; при `copy=False` кадры не копируются из его
+    кольцевого буфера, и выданный кадр остается валидным только до получения следующего за ним кадра.
 
     :param video_path: str, путь к видеофайлу.
     :param start_frame: int, опциональный параметр, номер первого кадра для чтения.
     :param step: int, опциональный параметр, шаг между кадрами для чтения.
     :param blur_sigma: float, опциональный параметр, стандартное отклонение для размытия изображения (если требуется).
     :param frame_count: int, опциональный параметр, максимальное количество кадров для чтения.
+    :param copy: bool, опциональный параметр, выдавать собственные копии кадров видеофайла (по умолчанию True).
     :return: generator, генератор кадров из видео.
     """
     if video_path.endswith("zvi"):
         return zvi_based_frame_generator(video_path, start_frame, step, blur_sigma, frame_count)
     else:
-        return video_based_frame_generator(video_path, start_frame, step, blur_sigma, frame_count)
\ No newline at end of file
+        return fast_video_frame_generator(video_path, start_frame, step, blur_sigma, frame_count, copy=copy)
\ No newline at end of file
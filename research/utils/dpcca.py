@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.stats import fit_crossover_curves
+
+
+def moving_average(arr, window, axis=0):
+    """
+    Функция вычисляет центрированное скользящее среднее по времени (у краев окно укорачивается,
+    длина ряда сохраняется).
+
+    :param arr: np.array, временные ряды.
+    :param window: int, размер окна.
+    :param axis: int, ось времени (по умолчанию 0).
+    :return: np.array, сглаженные ряды той же формы.
+    """
+
+    arr = np.moveaxis(np.asarray(arr, dtype=np.float64), axis, 0)
+    T = arr.shape[0]
+    cumsum = np.concatenate([np.zeros((1,) + arr.shape[1:]), np.cumsum(arr, axis=0)])
+    idx = np.arange(T)
+    lo = np.clip(idx - (window - 1) // 2, 0, T)
+    hi = np.clip(idx + window // 2 + 1, 0, T)
+    counts = (hi - lo).reshape((T,) + (1,) * (arr.ndim - 1))
+    return np.moveaxis((cumsum[hi] - cumsum[lo]) / counts, 0, axis)
+
+
+def detrending_basis(s, order):
+    """
+    Функция строит ортонормированный базис полиномов степени не выше `order` на окне длины `s`.
+    Остаток после детрендирования окна `w` равен `w - (w @ Q) @ Q.T`.
+
+    :param s: int, длина окна.
+    :param order: int, степень детрендирующего полинома.
+    :return: np.array, (s, order + 1) базис Q.
+    """
+
+    t = np.linspace(-1, 1, s)
+    q, _ = np.linalg.qr(np.vander(t, order + 1, increasing=True))
+    return q
+
+
+def detrended_covariances(arr, scales, order=2, step=1.0):
+    """
+    Функция вычисляет матрицы детрендированных ковариаций F^2(s) всех пар каналов для всех масштабов.
+
+    Профили (кумулятивные суммы центрированных рядов) нарезаются на окна длины s с шагом `step * s`,
+    полиномиальный тренд удаляется из всех окон и каналов одной матричной операцией, ковариации
+    остатков всех пар каналов вычисляются одним матричным произведением. Диагональ — F^2 DFA,
+    внедиагональные элементы — F^2 DCCA.
+
+    :param arr: np.array, (..., T, C) временные ряды (T — время, C — каналы); ведущие измерения —
+            независимые наборы рядов одинаковой длины.
+    :param scales: list, временные масштабы.
+    :param order: int, степень детрендирующего полинома (по умолчанию 2).
+    :param step: float, шаг между окнами в долях масштаба (по умолчанию 1 — окна не перекрываются).
+    :return: np.array, (..., len(scales), C, C) F^2(s); для масштабов, больших длины ряда или не превышающих
+            order + 1, — NaN.
+    """
+
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.ndim == 1:
+        arr = arr[:, None]
+    T, C = arr.shape[-2:]
+    profile = np.cumsum(arr - arr.mean(axis=-2, keepdims=True), axis=-2)
+
+    f2 = np.full(arr.shape[:-2] + (len(scales), C, C), np.nan)
+    for i, s in enumerate(scales):
+        s = int(s)
+        if s > T or s <= order + 1:
+            continue
+        starts = np.arange(0, T - s + 1, max(int(step * s), 1))
+        # (..., n_win, C, s)
+        windows = sliding_window_view(profile, s, axis=-2)[..., starts, :, :]
+        q = detrending_basis(s, order)
+        resid = windows - (windows @ q) @ q.T
+        # (..., C, n_win * s)
+        resid = np.swapaxes(resid, -3, -2).reshape(arr.shape[:-2] + (C, -1))
+        f2[..., i, :, :] = resid @ np.swapaxes(resid, -1, -2) / (len(starts) * (s - 1))
+    return f2
+
+
+def correlation_coefficients(f2):
+    """
+    Функция вычисляет коэффициенты DCCA (rho) и частичные коэффициенты DPCCA по матрицам F^2(s).
+
+    :param f2: np.array, (..., C, C) детрендированные ковариации.
+    :return: tuple, (p, r) — частичные и обычные коэффициенты корреляции той же формы.
+    """
+
+    diag = np.sqrt(np.diagonal(f2, axis1=-2, axis2=-1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = f2 / (diag[..., :, None] * diag[..., None, :])
+        valid = np.all(np.isfinite(r), axis=(-2, -1))
+        inv = np.zeros_like(r)
+        inv[valid] = np.linalg.pinv(r[valid])
+        inv_diag = np.sqrt(np.abs(np.diagonal(inv, axis1=-2, axis2=-1)))
+        p = -inv / (inv_diag[..., :, None] * inv_diag[..., None, :])
+    idx = np.arange(r.shape[-1])
+    p[..., idx, idx] = 1
+    p[~valid] = np.nan
+    return p, r
+
+
+def dpcca(arr, scales, order=2, step=1.0):
+    """
+    Функция выполняет DFA, DCCA и DPCCA для всех каналов и всех пар каналов на всех масштабах
+    (аналог `StatTools.analysis.dpcca.dpcca` для ряда формы (T, C)).
+
+    :param arr: np.array, (..., T, C) временные ряды.
+    :param scales: list, временные масштабы.
+    :param order: int, степень детрендирующего полинома (по умолчанию 2).
+    :param step: float, шаг между окнами в долях масштаба (по умолчанию 1).
+    :return: tuple, (p, r, f2, scales) — частичные коэффициенты DPCCA, коэффициенты DCCA и F^2(s)
+            формы (..., len(scales), C, C), масштабы.
+    """
+
+    f2 = detrended_covariances(arr, scales, order, step)
+    p, r = correlation_coefficients(f2)
+    return p, r, f2, np.asarray(scales)
+
+
+def fluctuation_curves(f2):
+    """
+    Функция преобразует F^2(s) в кривые F(s) = sqrt(|F^2(s)|) с масштабом в последней оси —
+    в формате входа `fit_crossover`.
+
+    :param f2: np.array, (..., n_scales, C, C) детрендированные ковариации.
+    :return: np.array, (..., C, C, n_scales) флуктуационные функции.
+    """
+
+    return np.moveaxis(np.sqrt(np.abs(f2)), -3, -1)
+
+
+def _file_dpcca(path, columns, scales, order, step, length, smooth):
+    data = pd.read_csv(path, index_col=0)[columns].dropna(axis=0, how='all')
+    arr = data.to_numpy(dtype=np.float64)[:length]
+    if smooth:
+        arr = moving_average(arr, smooth)
+    p, r, f2, _ = dpcca(arr, scales, order, step)
+    return p, r, f2
+
+
+def cohort_dpcca(files, columns, scales, order=2, step=1.0, length=None, smooth=None, workers=None):
+    """
+    Функция выполняет DFA/DCCA/DPCCA для набора файлов траекторий (CSV, по столбцу на канал) в пуле процессов.
+
+    :param files: list, пути к CSV-файлам.
+    :param columns: list, имена столбцов-каналов (например, координаты x частей тела).
+    :param scales: list, временные масштабы (см. `compute_temporal_scales`).
+    :param order: int, степень детрендирующего полинома (по умолчанию 2).
+    :param step: float, шаг между окнами в долях масштаба (по умолчанию 1).
+    :param length: int, опционально: длина, до которой обрезаются траектории (например, минимальная по когорте).
+    :param smooth: int, опционально: окно скользящего среднего для предварительного сглаживания.
+    :param workers: int, количество процессов (по умолчанию os.cpu_count()).
+    :return: dict, массивы p, r, f2 формы (len(files), len(scales), C, C), а также files, columns, scales.
+    """
+
+    n = len(files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_file_dpcca, files, [columns] * n, [scales] * n, [order] * n,
+                                    [step] * n, [length] * n, [smooth] * n))
+    p, r, f2 = (np.stack(a) for a in zip(*results))
+    return {"p": p, "r": r, "f2": f2, "files": list(files), "columns": list(columns), "scales": np.asarray(scales)}
+
+
+def store_dpcca(store, columns, scales, order=2, step=1.0, length=None, smooth=None, batch_size=16):
+    """
+    Функция выполняет DFA/DCCA/DPCCA для всех файлов бинарного хранилища траекторий: траектории,
+    обрезанные до общей длины, обрабатываются пакетами по `batch_size` файлов одним вызовом
+    `detrended_covariances`.
+
+    :param store: TrajectoryStore, хранилище траекторий.
+    :param columns: list, имена столбцов-каналов.
+    :param scales: list, временные масштабы.
+    :param order: int, степень детрендирующего полинома (по умолчанию 2).
+    :param step: float, шаг между окнами в долях масштаба (по умолчанию 1).
+    :param length: int, опционально: общая длина траекторий (по умолчанию минимальная в хранилище).
+    :param smooth: int, опционально: окно скользящего среднего для предварительного сглаживания.
+    :param batch_size: int, количество файлов в пакете (по умолчанию 16).
+    :return: dict, как у `cohort_dpcca`, дополнительно groups.
+    """
+
+    if length is None:
+        length = store.min_length()
+    f2 = np.empty((len(store), len(scales), len(columns), len(columns)))
+    for begin in range(0, len(store), batch_size):
+        arr = store.stack(columns, length, keys=range(begin, min(begin + batch_size, len(store))))
+        if smooth:
+            arr = moving_average(arr, smooth, axis=-2)
+        f2[begin:begin + len(arr)] = detrended_covariances(arr, scales, order, step)
+    p, r = correlation_coefficients(f2)
+    return {"p": p, "r": r, "f2": f2, "files": store.names, "groups": store.groups, "columns": list(columns),
+            "scales": np.asarray(scales)}
+
+
+def save_cohort(path, result):
+    """
+    Функция сохраняет результаты `cohort_dpcca`/`store_dpcca` (и, например, перекресты) в `.npz` 
+    без преобразования массивов в строки. Отсутствующие значения в списках строк (например, группа
+    None) сохраняются пустыми строками, поэтому файл читается без `allow_pickle`.
+
+    :param path: str, путь к файлу `.npz`.
+    :param result: dict, массивы и списки строк (files, groups, columns).
+    """
+
+    def to_array(value):
+        if isinstance(value, (list, tuple)) and any(item is None for item in value):
+            value = ["" if item is None else item for item in value]
+        return np.asarray(value)
+
+    np.savez(path, **{key: to_array(value) for key, value in result.items()})
+
+
+def load_cohort(path):
+    """
+    :param path: str, путь к файлу `.npz` (см. `save_cohort`).
+    :return: dict, сохраненные массивы; списки строк возвращаются списками (пустые строки — None).
+    """
+
+    with np.load(path) as f:
+        return {key: [item or None for item in f[key].tolist()] if f[key].dtype.kind == 'U' else f[key] 
+                for key in f.files}
+
+
+def cohort_crossovers(f2, scales, min_points=4):
+    """
+    Функция находит перекрест и наклоны режимов масштабирования (`fit_crossover`) для кривых F(s)
+    всех файлов и всех пар каналов одним вызовом.
+
+    :param f2: np.array, (..., n_scales, C, C) детрендированные ковариации (например, `cohort_dpcca(...)["f2"]`).
+    :param scales: list, временные масштабы.
+    :param min_points: int, минимальное количество точек на участке (по умолчанию 4).
+    :return: tuple, (crossover, slope_l, slope_h) формы (..., C, C); crossover — масштаб перекреста.
+            Для кривых с пропусками (например, из-за NaN в траекториях) результаты равны NaN.
+    """
+
+    return fit_crossover_curves(fluctuation_curves(f2), scales, min_points)
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+# Форматы хранения потока в кэше: float16 — половинная точность, int16 — целые с масштабом,
+# вычисляемым для каждой компоненты каждого видео по максимальному модулю
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int16": np.int16}
+
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Функция вычисляет SHA-256 содержимого файла.
+
+    :param path: str, путь к файлу.
+    :param block_size: int, размер блока чтения в байтах.
+    :return: str, шестнадцатеричный хэш.
+    """
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class QuantizedArray:
+    """
+    Массив потока, хранящийся в компактном формате (float16 или int16 с масштабом) и 
+    преобразуемый в float32 при индексации. Поддерживает операции, которые используют потребители
+    кэша: `shape`, `len`, индексацию и срезы, итерацию по кадрам, `reshape` и `np.asarray`.
+    """
+
+    def __init__(self, data, scale=1.0, dtype=np.float32):
+        """
+        :param data: np.array, хранимые значения (как правило, `np.memmap`).
+        :param scale: float, множитель для получения исходных значений.
+        :param dtype: тип данных результата индексации (по умолчанию np.float32).
+        """
+
+        self.data = data
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        values = np.asarray(self.data[index]).astype(self.dtype)
+        if self.scale != 1:
+            values *= self.dtype.type(self.scale)
+        return values
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[...]
+        return values if dtype is None else values.astype(dtype)
+
+    def reshape(self, *shape):
+        return QuantizedArray(self.data.reshape(*shape), self.scale, self.dtype)
+
+
+def quantize(arr, storage):
+    """
+    Функция преобразует поток в формат хранения.
+
+    :param arr: np.array, значения потока.
+    :param storage: str, формат хранения (см. `STORAGE_DTYPES`).
+    :return: tuple, (values, scale) — хранимые значения и множитель для восстановления.
+    """
+
+    dtype = np.dtype(STORAGE_DTYPES[storage])
+    if dtype.kind != 'i':
+        return np.asarray(arr).astype(dtype), 1.0
+    max_abs = float(np.max(np.abs(arr))) if np.size(arr) else 0.0
+    scale = max_abs / INT16_MAX if max_abs > 0 else 1.0
+    return _quantize_int(arr, scale, dtype), scale
+
+
+def _quantize_int(arr, scale, dtype):
+    return np.clip(np.rint(np.asarray(arr, dtype=np.float64) / scale), -INT16_MAX, INT16_MAX).astype(dtype)
+
+
+class FlowCache:
+    """
+    Кэш оптического потока, адресуемый по содержимому.
+
+    Каждая запись — каталог `<cache_dir>/<key>/` с файлами `vs.npy`, `us.npy` и `meta.json`.
+    Ключ — хэш содержимого входного файла и всех параметров вычисления потока, поэтому изменение
+    конфигурации не приводит к чтению устаревших данных. Массивы открываются через `np.memmap`
+    без копирования, можно читать отдельные диапазоны кадров. Общий размер кэша ограничивается
+    `max_bytes`, лишние записи удаляются в порядке давности использования (LRU).
+    """
+
+    DIGESTS_DIR = "digests"
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        :param cache_dir: str, путь к каталогу кэша.
+        :param max_bytes: int, опционально: максимальный суммарный размер записей в байтах.
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_file, **flow_params):
+        """
+        Функция вычисляет ключ записи по содержимому входного файла и параметрам потока.
+
+        :param input_file: str, путь к видеофайлу.
+        :param flow_params: параметры вычисления потока (кадры, шаг, размытие, параметры алгоритма и т.д.).
+        :return: str, ключ записи.
+        """
+
+        payload = json.dumps({"input": self._input_digest(input_file), "params": flow_params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _input_digest(self, input_file):
+        # Хэш содержимого запоминается по (путь, размер, время изменения), чтобы не читать видео повторно.
+        # Каждый хэш хранится в отдельном файле, записываемом атомарно, поэтому процессы, работающие 
+        # с одним каталогом кэша, не мешают друг другу
+        stat = os.stat(input_file)
+        stamp = f"{os.path.abspath(input_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+        digests_dir = os.path.join(self.cache_dir, self.DIGESTS_DIR)
+        digest_path = os.path.join(digests_dir, hashlib.sha256(stamp.encode()).hexdigest()[:32])
+        try:
+            with open(digest_path) as f:
+                return f.read()
+        except OSError:
+            pass
+        digest = file_digest(input_file)
+        os.makedirs(digests_dir, exist_ok=True)
+        tmp_path = f"{digest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(digest)
+        os.replace(tmp_path, digest_path)
+        return digest
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def path(self, key, name):
+        """
+        :param key: str, ключ записи.
+        :param name: str, имя файла внутри записи.
+        :return: str, путь к файлу записи.
+        """
+
+        return os.path.join(self._entry_dir(key), name)
+
+    def contains(self, key):
+        """
+        :param key: str, ключ записи.
+        :return: bool, True, если запись существует.
+        """
+
+        return os.path.exists(os.path.join(self._entry_dir(key), "meta.json"))
+
+    def get(self, key, frames=None):
+        """
+        Функция открывает запись кэша без копирования в память.
+
+        :param key: str, ключ записи.
+        :param frames: slice, опционально: диапазон кадров для чтения.
+        :return: tuple, (vs, us) в виде `np.memmap` (для компактных форматов — `QuantizedArray`) 
+                или None, если записи нет (в том числе если ее удалил другой процесс).
+        """
+
+        entry_dir = self._entry_dir(key)
+        try:
+            os.utime(os.path.join(entry_dir, "meta.json"))
+            meta = self.meta(key)
+            arrays = []
+            for name in ("vs.npy", "us.npy"):
+                arr = np.load(os.path.join(entry_dir, name), mmap_mode='r')
+                if frames is not None:
+                    arr = arr[frames]
+                if meta.get("storage", "float32") != "float32":
+                    arr = QuantizedArray(arr, meta["scales"][name])
+                arrays.append(arr)
+        except FileNotFoundError:
+            # Записи нет или она удалена другим процессом (`evict`); открытые `np.memmap` остаются
+            # доступными и после удаления файлов
+            return None
+        return tuple(arrays)
+
+    def meta(self, key):
+        """
+        :param key: str, ключ записи.
+        :return: dict, метаданные записи.
+        """
+
+        with open(os.path.join(self._entry_dir(key), "meta.json")) as f:
+            return json.load(f)
+
+    def create(self, key, shape, dtype=np.float32):
+        """
+        Функция создает незавершенную запись и возвращает дисковые буферы для записи потока.
+
+        :param key: str, ключ записи.
+        :param shape: tuple, максимальная форма массивов (N, H, W).
+        :param dtype: тип данных (по умолчанию np.float32).
+        :return: tuple, (tmp_dir, vs, us) — временный каталог записи и буферы `np.memmap`.
+        """
+
+        tmp_dir = os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.part")
+        os.makedirs(tmp_dir)
+        vs_out = open_flow_buffer(os.path.join(tmp_dir, "vs.npy"), shape, dtype)
+        us_out = open_flow_buffer(os.path.join(tmp_dir, "us.npy"), shape, dtype)
+        return tmp_dir, vs_out, us_out
+
+    def commit(self, key, tmp_dir, length, meta=None, storage="float32"):
+        """
+        Функция завершает запись: обрезает буферы до `length` кадров и переводит их в формат
+        хранения, сохраняет метаданные, атомарно публикует запись и применяет ограничение размера.
+
+        :param key: str, ключ записи.
+        :param tmp_dir: str, временный каталог, полученный из `create`.
+        :param length: int, фактическое количество кадров.
+        :param meta: dict, опционально: дополнительные метаданные.
+        :param storage: str, формат хранения (см. `STORAGE_DTYPES`, по умолчанию "float32").
+        """
+
+        scales = {}
+        for name in ("vs.npy", "us.npy"):
+            scales[name] = shrink_flow_buffer(os.path.join(tmp_dir, name), length, storage=storage)
+        with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+            json.dump({"length": length, "created": time.time(), "storage": storage, "scales": scales, 
+                       **(meta or {})}, f, default=str)
+        entry_dir = self._entry_dir(key)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Запись уже создана другим процессом
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def discard(self, tmp_dir):
+        """
+        :param tmp_dir: str, временный каталог незавершенной записи.
+        """
+
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def entries(self):
+        """
+        :return: list, список (key, last_access, size_bytes) для всех завершенных записей.
+        """
+
+        result = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if not os.path.isfile(meta_path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+                last_access = os.path.getmtime(meta_path)
+            except FileNotFoundError:
+                # Запись удаляется другим процессом
+                continue
+            result.append((key, last_access, size))
+        return result
+
+    def evict(self, max_bytes=None, keep=None):
+        """
+        Функция удаляет наименее недавно использованные записи, пока размер кэша превышает лимит.
+
+        :param max_bytes: int, опционально: лимит в байтах (по умолчанию `self.max_bytes`).
+        :param keep: str, опционально: ключ записи, которую удалять нельзя (например, только что созданной).
+        :return: list, ключи удаленных записей.
+        """
+
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return []
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for key, _, size in entries:
+            if total <= max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+
+def open_flow_buffer(path, shape, dtype=np.float32):
+    """
+    Функция создает дисковый буфер `.npy` для компоненты оптического потока.
+
+    :param path: str, путь к файлу буфера.
+    :param shape: tuple, форма массива (N, H, W).
+    :param dtype: тип данных (по умолчанию np.float32).
+    :return: np.memmap, буфер, открытый на запись.
+    """
+
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+
+def shrink_flow_buffer(path, length, chunk=64, storage="float32"):
+    """
+    Функция обрезает дисковый буфер `.npy` до первых `length` кадров (если видео оказалось короче)
+    и переводит его в формат хранения `storage`.
+
+    :param path: str, путь к файлу буфера.
+    :param length: int, количество кадров, которое нужно сохранить.
+    :param chunk: int, количество кадров, копируемых за один шаг.
+    :param storage: str, формат хранения (см. `STORAGE_DTYPES`, по умолчанию "float32"), в который
+            переводится буфер.
+    :return: float, множитель для восстановления значений (1 для форматов с плавающей точкой).
+    """
+
+    dtype = np.dtype(STORAGE_DTYPES[storage])
+    src = np.load(path, mmap_mode='r')
+    scale = 1.0
+    if dtype.kind == 'i':
+        max_abs = max((float(np.max(np.abs(src[begin:begin + chunk]))) for begin in range(0, length, chunk)),
+                      default=0.0)
+        scale = max_abs / INT16_MAX if max_abs > 0 else 1.0
+    if src.shape[0] == length and src.dtype == dtype:
+        return scale
+    tmp_path = path + ".tmp.npy"
+    dst = open_flow_buffer(tmp_path, (length,) + src.shape[1:], dtype)
+    for begin in range(0, length, chunk):
+        end = min(begin + chunk, length)
+        if dtype.kind == 'i':
+            dst[begin:end] = _quantize_int(src[begin:end], scale, dtype)
+        else:
+            dst[begin:end] = src[begin:end]
+    dst.flush()
+    del src, dst
+    os.replace(tmp_path, path)
+    return scale
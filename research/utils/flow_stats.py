@@ -0,0 +1,215 @@
+import numpy as np
+
+
+class FlowStatistics:
+    """
+    Однопроходный накопитель статистик оптического потока.
+
+    Собирает гистограммы с фиксированными интервалами для компонент vs и us (для оценки квантилей
+    без сортировки всего массива), а также попиксельные суммы и количества — все значения и значения
+    под маской. Накопители можно объединять (`merge`), сохранять и загружать.
+    """
+
+    def __init__(self, bins=8192, value_range=(-32.0, 32.0)):
+        """
+        :param bins: int, количество интервалов гистограммы (по умолчанию 8192).
+        :param value_range: tuple, диапазон значений гистограммы; значения вне диапазона учитываются
+                отдельно, а квантили в этих областях оцениваются по минимуму/максимуму.
+        """
+
+        self.bins = bins
+        self.value_range = (float(value_range[0]), float(value_range[1]))
+        self.hist = {c: np.zeros(bins + 2, dtype=np.int64) for c in ("v", "u")}
+        self.min = {c: np.inf for c in ("v", "u")}
+        self.max = {c: -np.inf for c in ("v", "u")}
+        self.sum = None
+        self.count = 0
+        self.masked_sum = None
+        self.masked_count = None
+
+    def _add_hist(self, component, values):
+        lo, hi = self.value_range
+        idx = np.floor((values.ravel() - lo) * (self.bins / (hi - lo))).astype(np.int64)
+        np.clip(idx + 1, 0, self.bins + 1, out=idx)
+        self.hist[component] += np.bincount(idx, minlength=self.bins + 2)
+        self.min[component] = min(self.min[component], float(values.min()))
+        self.max[component] = max(self.max[component], float(values.max()))
+
+    def update(self, v, u, mask=None):
+        """
+        Функция добавляет в накопитель один кадр или пакет кадров.
+
+        :param v: np.array, (H, W) или (N, H, W) вертикальная компонента потока.
+        :param u: np.array, (H, W) или (N, H, W) горизонтальная компонента потока.
+        :param mask: np.array, опционально: булева маска, совместимая по форме с `v`.
+        """
+
+        v = np.asarray(v)
+        u = np.asarray(u)
+        if v.ndim == 2:
+            v, u = v[None], u[None]
+            mask = None if mask is None else np.asarray(mask)[None]
+        if v.shape[0] == 0:
+            return
+        self._add_hist("v", v)
+        self._add_hist("u", u)
+        if self.sum is None:
+            self.sum = {c: np.zeros(v.shape[1:], dtype=np.float64) for c in ("v", "u")}
+        self.sum["v"] += v.sum(axis=0, dtype=np.float64)
+        self.sum["u"] += u.sum(axis=0, dtype=np.float64)
+        self.count += v.shape[0]
+        if mask is not None:
+            mask = np.broadcast_to(mask, v.shape)
+            if self.masked_sum is None:
+                self.masked_sum = {c: np.zeros(v.shape[1:], dtype=np.float64) for c in ("v", "u")}
+                self.masked_count = np.zeros(v.shape[1:], dtype=np.int64)
+            self.masked_sum["v"] += np.sum(v, axis=0, where=mask, dtype=np.float64)
+            self.masked_sum["u"] += np.sum(u, axis=0, where=mask, dtype=np.float64)
+            self.masked_count += mask.sum(axis=0)
+
+    def merge(self, other):
+        """
+        Функция объединяет накопитель с другим (с теми же параметрами гистограммы).
+
+        :param other: FlowStatistics.
+        :return: FlowStatistics, self.
+        """
+
+        if (other.bins, other.value_range) != (self.bins, self.value_range):
+            raise ValueError("Histogram parameters of merged statistics differ")
+        for c in ("v", "u"):
+            self.hist[c] += other.hist[c]
+            self.min[c] = min(self.min[c], other.min[c])
+            self.max[c] = max(self.max[c], other.max[c])
+        for name in ("sum", "masked_sum"):
+            theirs = getattr(other, name)
+            if theirs is None:
+                continue
+            if getattr(self, name) is None:
+                setattr(self, name, {c: theirs[c].copy() for c in ("v", "u")})
+            else:
+                for c in ("v", "u"):
+                    getattr(self, name)[c] += theirs[c]
+        self.count += other.count
+        if other.masked_count is not None:
+            self.masked_count = other.masked_count.copy() if self.masked_count is None \
+                                else self.masked_count + other.masked_count
+        return self
+
+    @classmethod
+    def from_arrays(cls, vs_np, us_np, mask=None, chunk=64, **kwargs):
+        """
+        Функция строит накопитель одним проходом по массивам (в том числе `np.memmap`) блоками по времени.
+
+        :param vs_np: np.array, (T, H, W) вертикальные компоненты потока.
+        :param us_np: np.array, (T, H, W) горизонтальные компоненты потока.
+        :param mask: np.array, опционально: маска формы (H, W) или (T, H, W).
+        :param chunk: int, количество кадров в блоке (по умолчанию 64).
+        :return: FlowStatistics.
+        """
+
+        flow_stats = cls(**kwargs)
+        for begin in range(0, len(vs_np), chunk):
+            mask_chunk = mask
+            if mask is not None and np.ndim(mask) == 3:
+                mask_chunk = mask[begin:begin + chunk]
+            flow_stats.update(vs_np[begin:begin + chunk], us_np[begin:begin + chunk], mask_chunk)
+        return flow_stats
+
+    def quantile(self, component, q):
+        """
+        Функция оценивает квантиль компоненты по гистограмме (точность — ширина интервала).
+
+        :param component: str, "v" или "u".
+        :param q: float, уровень квантиля от 0 до 1.
+        :return: float, значение квантиля.
+        """
+
+        hist = self.hist[component]
+        total = hist.sum()
+        if total == 0:
+            return np.nan
+        lo, hi = self.value_range
+        width = (hi - lo) / self.bins
+        # Границы интервалов с учетом областей вне диапазона
+        edges = np.concatenate([[min(self.min[component], lo)],
+                                lo + width * np.arange(self.bins + 1),
+                                [max(self.max[component], hi)]])
+        edges = np.clip(edges, self.min[component], self.max[component])
+        cum = np.concatenate([[0], np.cumsum(hist)])
+        target = q * total
+        i = int(np.clip(np.searchsorted(cum, target, side='left') - 1, 0, len(hist) - 1))
+        frac = (target - cum[i]) / hist[i] if hist[i] > 0 else 0.0
+        return float(edges[i] + frac * (edges[i + 1] - edges[i]))
+
+    def mean(self):
+        """
+        :return: tuple, попиксельные средние (v_mean, u_mean) по времени.
+        """
+
+        return self.sum["v"] / self.count, self.sum["u"] / self.count
+
+    def masked_mean(self):
+        """
+        :return: tuple, попиксельные средние (v_mean, u_mean) по значениям под маской (NaN, если их нет).
+        """
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.masked_sum["v"] / self.masked_count, self.masked_sum["u"] / self.masked_count
+
+    def save(self, path):
+        """
+        :param path: str, путь к файлу `.npz`.
+        """
+
+        arrays = dict(bins=self.bins, value_range=self.value_range, count=self.count,
+                      hist_v=self.hist["v"], hist_u=self.hist["u"],
+                      min=[self.min["v"], self.min["u"]], max=[self.max["v"], self.max["u"]])
+        if self.sum is not None:
+            arrays.update(sum_v=self.sum["v"], sum_u=self.sum["u"])
+        if self.masked_sum is not None:
+            arrays.update(masked_sum_v=self.masked_sum["v"], masked_sum_u=self.masked_sum["u"],
+                          masked_count=self.masked_count)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: str, путь к файлу `.npz`.
+        :return: FlowStatistics.
+        """
+
+        with np.load(path) as f:
+            flow_stats = cls(int(f["bins"]), tuple(f["value_range"]))
+            flow_stats.count = int(f["count"])
+            flow_stats.hist = {"v": f["hist_v"], "u": f["hist_u"]}
+            flow_stats.min = {"v": float(f["min"][0]), "u": float(f["min"][1])}
+            flow_stats.max = {"v": float(f["max"][0]), "u": float(f["max"][1])}
+            if "sum_v" in f:
+                flow_stats.sum = {"v": f["sum_v"], "u": f["sum_u"]}
+            if "masked_sum_v" in f:
+                flow_stats.masked_sum = {"v": f["masked_sum_v"], "u": f["masked_sum_u"]}
+                flow_stats.masked_count = f["masked_count"]
+        return flow_stats
+
+
+def mean_above(arr, thresh, chunk=64):
+    """
+    Функция вычисляет попиксельное среднее по времени значений, превышающих порог, блоками по времени
+    (эквивалент `arr.mean(axis=0, where=arr > thresh)` без полноразмерной маски).
+
+    :param arr: np.array, (T, H, W) массив (в том числе `np.memmap`).
+    :param thresh: float, порог.
+    :param chunk: int, количество кадров в блоке (по умолчанию 64).
+    :return: np.array, (H, W) средние значения (NaN, если значений выше порога нет).
+    """
+
+    sums = np.zeros(arr.shape[1:], dtype=np.float64)
+    counts = np.zeros(arr.shape[1:], dtype=np.int64)
+    for begin in range(0, len(arr), chunk):
+        block = np.asarray(arr[begin:begin + chunk])
+        above = block > thresh
+        sums += np.sum(block, axis=0, where=above, dtype=np.float64)
+        counts += above.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
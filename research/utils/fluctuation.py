@@ -0,0 +1,264 @@
+import numpy as np
+
+from utils.stats import fit_crossover_curves
+
+# Точность вычислений флуктуационного анализа: тип кумулятивных сумм комплексного поля
+PRECISIONS = {"double": np.complex128, "single": np.complex64}
+
+
+def window_stride(w_size: int) -> int:
+    """
+    Функция возвращает шаг между началами окон для временного масштаба (как в `video_process`).
+
+    :param w_size: int, размер окна.
+    :return: int, шаг между окнами.
+    """
+
+    return max(w_size // 4, 1)
+
+
+def windowed_sum_moments(vs_chunk, us_chunk, temporal_scales, reduce=True, dtype=np.complex128):
+    """
+    Функция вычисляет моменты оконных сумм комплексного поля `vs + 1j * us` для всех масштабов
+    по одной кумулятивной сумме по времени.
+
+    :param vs_chunk: np.array, (T, ...) вертикальная компонента оптического потока.
+    :param us_chunk: np.array, (T, ...) горизонтальная компонента оптического потока.
+    :param temporal_scales: list, временные масштабы.
+    :param reduce: bool, суммировать моменты по всем пикселям (по умолчанию True); при False моменты
+            возвращаются для каждого пикселя (ряда) отдельно, формы (len(temporal_scales), ...).
+    :param dtype: тип кумулятивных сумм (np.complex128 или np.complex64); моменты накапливаются в float64.
+    :return: tuple, (count, sums, sq_sums) — количество оконных сумм, их сумма и сумма квадратов модулей
+            для каждого масштаба.
+    """
+
+    T = vs_chunk.shape[0]
+    cumsum = np.zeros((T + 1,) + vs_chunk.shape[1:], dtype=dtype)
+    np.cumsum(vs_chunk, axis=0, out=cumsum.real[1:])
+    np.cumsum(us_chunk, axis=0, out=cumsum.imag[1:])
+
+    n_pix = int(np.prod(vs_chunk.shape[1:])) if reduce else 1
+    shape = (len(temporal_scales),) + (() if reduce else vs_chunk.shape[1:])
+    count = np.zeros(len(temporal_scales), dtype=np.int64)
+    sums = np.zeros(shape, dtype=np.complex128)
+    sq_sums = np.zeros(shape, dtype=np.float64)
+    axis = None if reduce else 0
+    for i, w_size in enumerate(temporal_scales):
+        if w_size > T:
+            continue
+        starts = np.arange(0, T - w_size + 1, window_stride(w_size))
+        window_sums = cumsum[starts + w_size] - cumsum[starts]
+        count[i] = len(starts) * n_pix
+        sums[i] = window_sums.sum(axis=axis, dtype=np.complex128)
+        sq_sums[i] = (window_sums.real ** 2 + window_sums.imag ** 2).sum(axis=axis, dtype=np.float64)
+    return count, sums, sq_sums
+
+
+def compute_fluctuations(vs_np, us_np, temporal_scales, chunk_size=4096, precision="double"):
+    """
+    Функция вычисляет флуктуационную характеристику H(S) оптического потока для всех временных
+    масштабов по кумулятивной сумме. Результат совпадает с
+    `np.std(np.sum(sliding_window_view(vs + 1j * us, S, axis=0)[::S//4], axis=-1))`.
+
+    Вычисления ведутся по блокам пространственной сетки, поэтому массивы могут быть `np.memmap`,
+    а пиковая память ограничена размером блока.
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты оптического потока.
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты оптического потока.
+    :param temporal_scales: list, временные масштабы.
+    :param chunk_size: int, количество пикселей в одном блоке (по умолчанию 4096).
+    :param precision: str, точность кумулятивных сумм: "double" (complex128) или "single" (complex64).
+    :return: np.array, значения H(S) для каждого масштаба.
+    """
+
+    T = vs_np.shape[0]
+    vs_flat = vs_np.reshape(T, -1)
+    us_flat = us_np.reshape(T, -1)
+    n_pix = vs_flat.shape[1]
+
+    count = np.zeros(len(temporal_scales), dtype=np.int64)
+    sums = np.zeros(len(temporal_scales), dtype=np.complex128)
+    sq_sums = np.zeros(len(temporal_scales), dtype=np.float64)
+    for begin in range(0, n_pix, chunk_size):
+        c, s, sq = windowed_sum_moments(vs_flat[:, begin:begin + chunk_size],
+                                        us_flat[:, begin:begin + chunk_size],
+                                        temporal_scales,
+                                        dtype=PRECISIONS[precision])
+        count += c
+        sums += s
+        sq_sums += sq
+    return moments_to_std(count, sums, sq_sums)
+
+
+def block_aggregate(vs_np, us_np, tile=16, chunk=64, dtype=np.float64):
+    """
+    Функция усредняет оптический поток по квадратным блокам `tile` x `tile` пикселей (неполные блоки
+    у правого и нижнего краев отбрасываются). Массивы читаются блоками по времени, поэтому могут
+    быть `np.memmap`.
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты оптического потока.
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты оптического потока.
+    :param tile: int, размер блока в пикселях (по умолчанию 16).
+    :param chunk: int, количество кадров в блоке чтения (по умолчанию 64).
+    :param dtype: тип данных результата (по умолчанию np.float64).
+    :return: tuple, (vs_tiles, us_tiles) формы (T, H // tile, W // tile).
+    """
+
+    T, H, W = vs_np.shape
+    rows, cols = H // tile, W // tile
+    vs_tiles = np.empty((T, rows, cols), dtype=dtype)
+    us_tiles = np.empty((T, rows, cols), dtype=dtype)
+    for begin in range(0, T, chunk):
+        for src, dst in ((vs_np, vs_tiles), (us_np, us_tiles)):
+            block = np.asarray(src[begin:begin + chunk, :rows * tile, :cols * tile], dtype=dtype)
+            dst[begin:begin + chunk] = block.reshape(len(block), rows, tile, cols, tile).mean(axis=(2, 4))
+    return vs_tiles, us_tiles
+
+
+def compute_fluctuation_maps(vs_np, us_np, temporal_scales, tile=16, min_points=4, precision="double"):
+    """
+    Функция вычисляет пространственные карты флуктуационного анализа: поток усредняется по блокам
+    `tile` x `tile` (`block_aggregate`), для ряда каждого блока вычисляется H(S) (как в 
+    `compute_fluctuations`), затем перекрест и наклоны режимов находятся для всех блоков одним 
+    вызовом `fit_crossover`.
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты оптического потока.
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты оптического потока.
+    :param temporal_scales: list, временные масштабы.
+    :param tile: int, размер блока в пикселях (по умолчанию 16).
+    :param min_points: int, минимальное количество точек на участке регрессии (по умолчанию 4).
+    :param precision: str, точность вычислений: "double" или "single" (float32/complex64).
+    :return: dict, карты формы (H // tile, W // tile): crossover (масштаб перекреста), slope_l, slope_h;
+            hs — кривые H(S) блоков формы (H // tile, W // tile, len(temporal_scales)); scales; tile.
+    """
+
+    dtype = PRECISIONS[precision]
+    vs_tiles, us_tiles = block_aggregate(vs_np, us_np, tile, dtype=np.finfo(dtype).dtype)
+    hs = moments_to_std(*windowed_sum_moments(vs_tiles, us_tiles, temporal_scales, reduce=False, dtype=dtype))
+    hs = np.moveaxis(hs, 0, -1)
+    crossover, slope_l, slope_h = fit_crossover_curves(hs, temporal_scales, min_points)
+    return {"crossover": crossover,
+            "slope_l": slope_l,
+            "slope_h": slope_h,
+            "hs": hs,
+            "scales": np.asarray(temporal_scales),
+            "tile": tile}
+
+
+def aggregate_signal(vs_np, us_np, tile=None, chunk=64):
+    """
+    Функция сводит поле потока к небольшому набору комплексных рядов `vs + 1j * us`: среднее по кадру
+    или средние по блокам `tile` x `tile` (см. `block_aggregate`).
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты оптического потока.
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты оптического потока.
+    :param tile: int, опционально: размер блока (по умолчанию — среднее по всему кадру).
+    :param chunk: int, количество кадров в блоке чтения (по умолчанию 64).
+    :return: np.array, (T, K) комплексные ряды (K = 1 или количество блоков).
+    """
+
+    if tile is None:
+        T = vs_np.shape[0]
+        signal = np.empty((T, 1), dtype=np.complex128)
+        for begin in range(0, T, chunk):
+            signal[begin:begin + chunk, 0].real = np.asarray(vs_np[begin:begin + chunk]).mean(axis=(1, 2))
+            signal[begin:begin + chunk, 0].imag = np.asarray(us_np[begin:begin + chunk]).mean(axis=(1, 2))
+        return signal
+    vs_tiles, us_tiles = block_aggregate(vs_np, us_np, tile, chunk)
+    return (vs_tiles + 1j * us_tiles).reshape(len(vs_tiles), -1)
+
+
+def make_surrogates(signal, n_surrogates, method="shuffle", rng=None):
+    """
+    Функция строит суррогатные ряды для проверки значимости масштабирования.
+
+    - "shuffle" — случайная перестановка моментов времени (разрушает временные корреляции,
+      сохраняет распределение значений);
+    - "phase" — рандомизация фаз спектра Фурье (сохраняет спектр мощности и, следовательно,
+      линейные корреляции, разрушает нелинейную структуру).
+
+    Перестановка или фазы общие для всех рядов K, поэтому их взаимные связи сохраняются.
+
+    :param signal: np.array, (T, K) комплексные ряды (см. `aggregate_signal`).
+    :param n_surrogates: int, количество суррогатов.
+    :param method: str, "shuffle" или "phase".
+    :param rng: np.random.Generator, опционально: генератор случайных чисел.
+    :return: np.array, (T, n_surrogates, K) суррогатные ряды.
+    """
+
+    rng = np.random.default_rng(rng)
+    T = signal.shape[0]
+    if method == "shuffle":
+        order = np.argsort(rng.random((n_surrogates, T)), axis=1)
+        return np.moveaxis(signal[order], 1, 0)
+    if method == "phase":
+        spectrum = np.fft.fft(signal, axis=0)
+        phases = np.exp(2j * np.pi * rng.random((T, n_surrogates, 1)))
+        # Нулевая частота (среднее) не меняется
+        phases[0] = 1
+        return np.fft.ifft(spectrum[:, None, :] * phases, axis=0)
+    raise ValueError(f"Unknown surrogate method {method!r}, expected 'shuffle' or 'phase'")
+
+
+def signal_fluctuations(signal, temporal_scales, precision="double"):
+    """
+    Функция вычисляет H(S) для одного или нескольких наборов рядов (как `compute_fluctuations`,
+    с объединением окон всех рядов набора).
+
+    :param signal: np.array, (T, K) или (T, N, K) комплексные ряды; N — наборы (например, суррогаты).
+    :param temporal_scales: list, временные масштабы.
+    :param precision: str, точность кумулятивных сумм ("double" или "single").
+    :return: np.array, (len(temporal_scales),) или (N, len(temporal_scales)) значения H(S).
+    """
+
+    signal = np.asarray(signal)
+    count, sums, sq_sums = windowed_sum_moments(signal.real, signal.imag, temporal_scales, reduce=False,
+                                                dtype=PRECISIONS[precision])
+    # Объединение моментов рядов K одного набора
+    count = count * signal.shape[-1]
+    hs = moments_to_std(count, sums.sum(axis=-1), sq_sums.sum(axis=-1))
+    return np.moveaxis(hs, 0, -1)
+
+
+def surrogate_fluctuations(signal, temporal_scales, n_surrogates=200, method="shuffle", seed=0,
+                           batch_size=None, precision="double"):
+    """
+    Функция вычисляет кривые H(S) для `n_surrogates` суррогатов сигнала пакетами, каждый пакет —
+    один векторизованный проход по кумулятивным суммам.
+
+    :param signal: np.array, (T, K) комплексные ряды (см. `aggregate_signal`).
+    :param temporal_scales: list, временные масштабы.
+    :param n_surrogates: int, количество суррогатов (по умолчанию 200).
+    :param method: str, "shuffle" или "phase" (см. `make_surrogates`).
+    :param seed: int, зерно генератора случайных чисел.
+    :param batch_size: int, опционально: количество суррогатов в пакете (по умолчанию подбирается так,
+            чтобы пакет занимал порядка 2**24 комплексных значений).
+    :param precision: str, точность кумулятивных сумм ("double" или "single").
+    :return: np.array, (n_surrogates, len(temporal_scales)) значения H(S).
+    """
+
+    rng = np.random.default_rng(seed)
+    if batch_size is None:
+        batch_size = max(1, 2 ** 24 // signal.size)
+    hs = np.empty((n_surrogates, len(temporal_scales)))
+    for begin in range(0, n_surrogates, batch_size):
+        n = min(batch_size, n_surrogates - begin)
+        hs[begin:begin + n] = signal_fluctuations(make_surrogates(signal, n, method, rng), temporal_scales, precision)
+    return hs
+
+
+def moments_to_std(count, sums, sq_sums):
+    """
+    Функция вычисляет стандартное отклонение комплексных величин по накопленным моментам.
+
+    :param count: np.array, количество значений.
+    :param sums: np.array, сумма значений.
+    :param sq_sums: np.array, сумма квадратов модулей значений.
+    :return: np.array, стандартное отклонение (NaN, если значений нет).
+    """
+
+    count = count.reshape(count.shape + (1,) * (np.ndim(sums) - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / count
+        var = sq_sums / count - (mean.real ** 2 + mean.imag ** 2)
+    return np.sqrt(np.maximum(var, 0))
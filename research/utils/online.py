@@ -0,0 +1,155 @@
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+from utils.data_generator import live_frame_generator
+from utils.fluctuation import PRECISIONS, moments_to_std, window_stride
+from utils.optical_flow import FlowEngine
+from utils.stats import fit_crossover_curves
+
+
+class OnlineFluctuationAnalyzer:
+    """
+    Инкрементальный флуктуационный анализ потока, поступающего по одному полю.
+
+    Хранится кольцевой буфер кумулятивных сумм комплексного поля `vs + 1j * us` за последние
+    max(S) кадров; при поступлении поля для каждого масштаба, окно которого завершилось
+    (начала окон — с шагом `window_stride(S)`, как в `compute_fluctuations`), оконная сумма
+    вычисляется как разность двух элементов буфера и добавляется к моментам масштаба.
+    Без ограничения `horizon` результат совпадает с `compute_fluctuations` для всех полученных кадров.
+    """
+
+    def __init__(self, temporal_scales, emit_every=25, horizon=None, min_points=4, precision="double"):
+        """
+        :param temporal_scales: list, временные масштабы.
+        :param emit_every: int, период (в полях потока) обновления H(S), перекреста и наклонов.
+        :param horizon: int, опционально: учитывать только окна, целиком попадающие в последние
+                `horizon` полей (по умолчанию — все поля с начала потока).
+        :param min_points: int, минимальное количество точек на участке регрессии (по умолчанию 4).
+        :param precision: str, точность кумулятивных сумм: "double" (complex128) или "single" (complex64).
+        """
+
+        self.temporal_scales = [int(s) for s in temporal_scales]
+        self.strides = [window_stride(s) for s in self.temporal_scales]
+        self.emit_every = emit_every
+        self.horizon = horizon
+        self.min_points = min_points
+        self.dtype = PRECISIONS[precision]
+        self.frames = 0
+        self.count = np.zeros(len(self.temporal_scales), dtype=np.int64)
+        self.sums = np.zeros(len(self.temporal_scales), dtype=np.complex128)
+        self.sq_sums = np.zeros(len(self.temporal_scales), dtype=np.float64)
+        self._windows = [deque() for _ in self.temporal_scales]
+        self._ring = None
+
+    def update(self, v, u):
+        """
+        Функция добавляет поле потока.
+
+        :param v: np.array, (H, W) вертикальная компонента потока.
+        :param u: np.array, (H, W) горизонтальная компонента потока.
+        :return: dict, результат `result()` на кадрах, кратных `emit_every`, иначе None.
+        """
+
+        size = max(self.temporal_scales) + 1
+        if self._ring is None:
+            self._ring = np.zeros((size,) + np.shape(v), dtype=self.dtype)
+        n = self.frames
+        if n > 0 and n % size == 0:
+            # Сдвиг всех кумулятивных сумм на константу не меняет разностей, но ограничивает их модуль
+            self._ring -= self._ring[n % size].copy()
+        prev = self._ring[n % size]
+        cur = self._ring[(n + 1) % size]
+        np.add(prev.real, v, out=cur.real)
+        np.add(prev.imag, u, out=cur.imag)
+        self.frames = n + 1
+
+        n_pix = cur.size
+        for i, (w_size, stride) in enumerate(zip(self.temporal_scales, self.strides)):
+            start = self.frames - w_size
+            if start < 0 or start % stride:
+                continue
+            window_sum = cur - self._ring[start % size]
+            s = complex(window_sum.sum(dtype=np.complex128))
+            sq = float((window_sum.real ** 2 + window_sum.imag ** 2).sum(dtype=np.float64))
+            self.count[i] += n_pix
+            self.sums[i] += s
+            self.sq_sums[i] += sq
+            if self.horizon is not None:
+                self._windows[i].append((start, n_pix, s, sq))
+
+        if self.horizon is not None:
+            for i, windows in enumerate(self._windows):
+                while windows and windows[0][0] < self.frames - self.horizon:
+                    _, n_pix, s, sq = windows.popleft()
+                    self.count[i] -= n_pix
+                    self.sums[i] -= s
+                    self.sq_sums[i] -= sq
+
+        if self.frames % self.emit_every == 0:
+            return self.result()
+        return None
+
+    def result(self):
+        """
+        :return: dict, текущие H(S) (NaN для масштабов без завершенных окон), масштаб перекреста и
+                наклоны режимов (NaN, пока точек недостаточно), количество полученных полей.
+        """
+
+        hs = moments_to_std(self.count, self.sums, self.sq_sums)
+        crossover, slope_l, slope_h = fit_crossover_curves(hs, self.temporal_scales, self.min_points)
+        return {"frame": self.frames,
+                "scales": self.temporal_scales,
+                "hs": hs.tolist(),
+                "crossover": float(crossover),
+                "slope_l": float(slope_l),
+                "slope_h": float(slope_h)}
+
+
+def _print_result(result):
+    print(json.dumps(result))
+
+
+def monitor(source, temporal_scales, engine=None, fps=None, blur_sigma=1, emit_every=25, horizon=None,
+            frame_count=np.iinfo(int).max, precision="double", callback=_print_result):
+    """
+    Функция выполняет онлайн-анализ источника кадров: оптический поток каждой новой пары кадров
+    сразу добавляется в `OnlineFluctuationAnalyzer`, а обновленные H(S), перекрест и наклоны
+    передаются в `callback` каждые `emit_every` полей вместе со статистикой задержки обработки кадра.
+
+    :param source: str или int, путь к видеофайлу, адрес потока или номер камеры.
+    :param temporal_scales: list, временные масштабы.
+    :param engine: FlowEngine, опционально: метод вычисления потока (по умолчанию `FlowEngine()` — Farneback).
+    :param fps: float, опционально: частота воспроизведения видеофайла (см. `live_frame_generator`).
+    :param blur_sigma: float, стандартное отклонение размытия кадров (по умолчанию 1, как в пакетном режиме).
+    :param emit_every: int, период выдачи результатов в полях потока (по умолчанию 25).
+    :param horizon: int, опционально: скользящий горизонт анализа в полях потока.
+    :param frame_count: int, максимальное количество кадров.
+    :param precision: str, точность кумулятивных сумм ("double" или "single").
+    :param callback: callable, функция, получающая результаты (по умолчанию печать JSON в stdout).
+    :return: dict, результат на последнем кадре.
+    """
+
+    if engine is None:
+        engine = FlowEngine()
+    analyzer = OnlineFluctuationAnalyzer(temporal_scales, emit_every, horizon, precision=precision)
+    latency_max = latency_total = 0.0
+    image0 = None
+    for frame in live_frame_generator(source, fps, blur_sigma, frame_count):
+        wall = time.perf_counter()
+        image1 = engine.prepare(frame)
+        if image0 is not None:
+            v, u = engine.compute(image0, image1)
+            result = analyzer.update(v, u)
+            latency = time.perf_counter() - wall
+            latency_max = max(latency_max, latency)
+            latency_total += latency
+            if result is not None:
+                callback({**result,
+                          "latency_s": latency,
+                          "latency_max_s": latency_max,
+                          "latency_mean_s": latency_total / analyzer.frames})
+        image0 = image1
+    return analyzer.result()
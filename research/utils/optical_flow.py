@@ -1,80 +1,495 @@
 import numpy as np
-from IPython.display import clear_output
 from skimage.registration import optical_flow_tvl1, optical_flow_ilk
-from cv2 import calcOpticalFlowFarneback
+import cv2
+from cv2 import calcOpticalFlowFarneback, setNumThreads
+from concurrent.futures import ProcessPoolExecutor
 import sys
-import pdb
 
-from tqdm.notebook import tqdm
 import os
-import json
+import itertools
+import time
 
 sys.path.append('..')
-from utils.data_generator import frame_generator
+from utils.data_generator import frame_generator, video_length
+from utils.flow_cache import FlowCache
+from utils.flow_stats import FlowStatistics
+from utils.profiling import StageProfiler, progress
+from utils.parallel import bounded_map
 
-with open('params.json') as f:
-        params = json.load(f)
+FARNEBACK_PARAMS = dict(pyr_scale=0.5,
+                        levels=1,
+                        winsize=15,
+                        iterations=3,
+                        poly_n=5,
+                        poly_sigma=1.2,
+                        flags=0)
 
-RECORD_DURATION = params['record_duration']
+FLOW_METHODS = ("farneback", "dis", "tvl1", "ilk")
 
-def compute_optical_flow(generator, radius=None, gen_length=None):
+DEFAULT_FLOW_PARAMS = {"farneback": FARNEBACK_PARAMS,
+                       "dis": dict(preset="medium"),
+                       "tvl1": dict(attachment=15, 
+                                    tightness=0.3, 
+                                    num_warp=5, 
+                                    num_iter=10, 
+                                    tol=1e-4, 
+                                    prefilter=False),
+                       "ilk": dict(radius=7, 
+                                   num_warp=10, 
+                                   gaussian=False, 
+                                   prefilter=False)}
+
+_DIS_PRESETS = {"ultrafast": cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST,
+                "fast": cv2.DISOPTICAL_FLOW_PRESET_FAST,
+                "medium": cv2.DISOPTICAL_FLOW_PRESET_MEDIUM}
+
+
+class FlowEngine:
+    """
+    Вычислитель оптического потока между парой кадров с выбираемым методом:
+
+    - "farneback" — `cv2.calcOpticalFlowFarneback`;
+    - "dis" — `cv2.DISOpticalFlow` (самый быстрый, для массовой обработки);
+    - "tvl1" — `skimage.registration.optical_flow_tvl1` (самый точный и медленный);
+    - "ilk" — `skimage.registration.optical_flow_ilk`.
+
+    Перед вычислением кадр можно обрезать до области интереса и уменьшить в `scale` раз. Поток 
+    возвращается на сетке уменьшенного кадра, но в пикселях исходного разрешения, поэтому величины
+    сопоставимы между режимами.
+    """
+
+    def __init__(self, method="farneback", scale=1.0, roi=None, value_range=None, **params):
+        """
+        :param method: str, метод вычисления потока (см. `FLOW_METHODS`).
+        :param scale: float, коэффициент масштабирования кадров (0 < scale <= 1).
+        :param roi: tuple, опционально: область интереса (x, y, width, height) в пикселях исходного кадра.
+        :param value_range: tuple, опционально: диапазон яркости (min, max) исходных кадров, по которому
+                кадры приводятся к 8 битам для метода "dis" (по умолчанию — минимум и максимум каждого кадра).
+        :param params: параметры метода, дополняющие `DEFAULT_FLOW_PARAMS[method]`. Для "dis" — 
+                `preset` ("ultrafast", "fast", "medium") и параметры сеттеров `cv2.DISOpticalFlow` 
+                в snake_case (например, `finest_scale`, `patch_size`).
+        """
+
+        if method not in FLOW_METHODS:
+            raise ValueError(f"Unknown optical flow method {method!r}, expected one of {FLOW_METHODS}")
+        if not 0 < scale <= 1:
+            raise ValueError(f"Flow scale must be in (0, 1], got {scale}")
+        self.method = method
+        self.scale = float(scale)
+        self.roi = None if roi is None else tuple(int(r) for r in roi)
+        self.value_range = None if value_range is None else tuple(float(r) for r in value_range)
+        self.params = {**DEFAULT_FLOW_PARAMS[method], **params}
+        self._dis = None
+
+    @classmethod
+    def from_params(cls, params):
+        """
+        Функция создает вычислитель по параметрам запуска (`params.json`):
+        `flow_method`, `flow_scale`, `flow_roi`, `flow_value_range` и `flow_params` — словарь параметров 
+        для каждого метода,
+        например `{"dis": {"preset": "fast"}, "tvl1": {"num_iter": 20}}`.
+
+        :param params: dict, параметры запуска.
+        :return: FlowEngine.
+        """
+
+        method = params.get("flow_method", "farneback")
+        return cls(method, 
+                   scale=params.get("flow_scale", 1.0), 
+                   roi=params.get("flow_roi"), 
+                   value_range=params.get("flow_value_range"),
+                   **params.get("flow_params", {}).get(method, {}))
+
+    def config(self):
+        """
+        :return: dict, описание вычислителя для ключа кэша и метаданных: метод, его параметры, а также
+                масштаб, область интереса и диапазон яркости, если они заданы.
+        """
+
+        config = dict(method=self.method, **self.params)
+        if self.scale != 1:
+            config["scale"] = self.scale
+        if self.roi is not None:
+            config["roi"] = list(self.roi)
+        if self.value_range is not None:
+            config["value_range"] = list(self.value_range)
+        return config
+
+    def __getstate__(self):
+        # Объект cv2.DISOpticalFlow не сериализуется и создается заново в процессе-исполнителе
+        state = self.__dict__.copy()
+        state["_dis"] = None
+        return state
+
+    def prepare(self, frame):
+        """
+        Функция обрезает кадр до области интереса, уменьшает его и приводит к типу данных метода:
+        Farneback получает кадр без преобразования (в том числе uint16 микроскопии), DIS — 8-битный кадр,
+        нормированный по диапазону яркости, методы skimage — float32.
+
+        :param frame: np.array, (H, W) кадр.
+        :return: np.array, подготовленный кадр.
+        """
+
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            # Срез не является непрерывным в памяти, а DIS принимает только непрерывные кадры
+            frame = np.ascontiguousarray(frame[y:y + height, x:x + width])
+        if self.scale != 1:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if self.method == "dis":
+            frame = self._to_uint8(frame)
+        elif self.method != "farneback":
+            frame = frame.astype(np.float32, copy=False)
+        return frame
+
+    def _to_uint8(self, frame):
+        if frame.dtype == np.uint8:
+            return frame
+        # Нормировка по фактическому диапазону данных: 12-битные кадры в uint16 при делении 
+        # на максимум типа сжались бы до 16 уровней яркости
+        low, high = self.value_range if self.value_range is not None else (frame.min(), frame.max())
+        span = float(high) - float(low)
+        if span <= 0:
+            return np.zeros(frame.shape, dtype=np.uint8)
+        return np.clip(np.rint((frame - float(low)) * (255 / span)), 0, 255).astype(np.uint8)
+
+    def compute(self, image0, image1):
+        """
+        Функция вычисляет поток между подготовленными (`prepare`) кадрами.
+
+        :param image0: np.array, предыдущий кадр.
+        :param image1: np.array, следующий кадр.
+        :return: tuple, (v, u) вертикальная и горизонтальная компоненты потока (float32).
+        """
+
+        if self.method == "farneback":
+            flow = calcOpticalFlowFarneback(prev=image0, next=image1, flow=None, **self.params)
+            v, u = flow[..., 1], flow[..., 0]
+        elif self.method == "dis":
+            flow = self._dis_instance().calc(image0, image1, None)
+            v, u = flow[..., 1], flow[..., 0]
+        elif self.method == "tvl1":
+            v, u = optical_flow_tvl1(image0, image1, dtype=np.float32, **self.params)
+        else:
+            v, u = optical_flow_ilk(image0, image1, dtype=np.float32, **self.params)
+        if self.scale != 1:
+            v = v / self.scale
+            u = u / self.scale
+        return v, u
+
+    def _dis_instance(self):
+        if self._dis is None:
+            params = dict(self.params)
+            self._dis = cv2.DISOpticalFlow_create(_DIS_PRESETS[params.pop("preset")])
+            for name, value in params.items():
+                getattr(self._dis, "set" + "".join(part.title() for part in name.split("_")))(value)
+        return self._dis
+
+    def __call__(self, frame0, frame1):
+        """
+        Функция вычисляет поток между двумя исходными кадрами.
+
+        :return: tuple, (v, u) вертикальная и горизонтальная компоненты потока.
+        """
+
+        return self.compute(self.prepare(frame0), self.prepare(frame1))
+
+
+def compute_optical_flow(generator, radius=None, gen_length=None, out=None, flow_stats=None, profiler=None,
+                         engine=None):
     """
     Функция для вычисления оптического потока.
+
+    Если задан `out` или `gen_length`, поля потока записываются сразу в заранее выделенные массивы
+    (в том числе `np.memmap`), без промежуточных списков. Массивы, выделенные по `gen_length`, 
+    увеличиваются, если генератор выдал больше кадров; для `out` это ошибка.
+
     :param generator: генератор кадров из видео.
     :param radius: int, радиус для вычисления оптического потока.
     :param gen_length: int, общее количество кадров в генераторе.
+    :param out: tuple, опционально: пара массивов (vs, us) формы (N, H, W) для записи результата;
+            N должно быть не меньше количества полей потока, иначе возникает ValueError.
+    :param flow_stats: FlowStatistics, опционально: накопитель статистик, обновляемый по мере вычисления.
+    :param profiler: StageProfiler, опционально: время чтения кадров и вычисления потока добавляется 
+            к этапам "decode" и "flow".
+    :param engine: FlowEngine, опционально: метод вычисления потока (по умолчанию `FlowEngine()` — Farneback).
     :return: tuple, компоненты оптического потока: vs (вертикальная компонента) и us (горизонтальная компонента).
     """
 
+    if engine is None:
+        engine = FlowEngine()
+    if profiler is None:
+        profiler = StageProfiler(enabled=False)
     vs, us = [], []
+    if out is not None:
+        vs, us = out
+    count = 0
     image0 = None
-    for frame_np in tqdm(generator, total=gen_length):
-        clear_output(wait=True)
+    for frame_np in progress(profiler.timed_iter(generator, "decode"), total=gen_length):
         #Build masked Image
-        frame_blur = frame_np # cv2.blur(frame_np,(5,5))
+        frame_blur = engine.prepare(frame_np) # cv2.blur(frame_np,(5,5))
         if image0 is None:
             image0 = frame_blur
+            if out is None and gen_length is not None:
+                vs = np.empty((max(gen_length - 1, 0),) + frame_blur.shape[:2], dtype=np.float32)
+                us = np.empty((max(gen_length - 1, 0),) + frame_blur.shape[:2], dtype=np.float32)
         else:
             # --- Compute the optical flow
             image1 = frame_blur
         
-            flow = calcOpticalFlowFarneback(prev=image0, 
-                                            next=image1,
-                                            flow=None,
-                                            pyr_scale=0.5,
-                                            levels=1,
-                                            winsize=15,
-                                            iterations=3,
-                                            poly_n=5,
-                                            poly_sigma=1.2,
-                                            flags=0)
-            v, u = flow[..., 1], flow[..., 0]
-            
+            with profiler.timed("flow"):
+                v, u = engine.compute(image0, image1)
+                image0 = image1
+                if flow_stats is not None:
+                    flow_stats.update(v, u)
+                
+                if isinstance(vs, list):
+                    vs.append(v)
+                    us.append(u)
+                else:
+                    if count == len(vs):
+                        if out is not None:
+                            raise ValueError(f"Output buffers hold {len(vs)} flow fields, "
+                                             f"but the generator yields more frames")
+                        # gen_length — только оценка длины (например, по заголовку видео)
+                        vs, us = _grow_buffer(vs), _grow_buffer(us)
+                    vs[count] = v
+                    us[count] = u
+            count += 1
+    if isinstance(vs, list):
+        return np.array(vs), np.array(us)
+    return vs[:count], us[:count]
+
+def _grow_buffer(buffer):
+    grown = np.empty((max(2 * len(buffer), 1),) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+def _compute_flow_chunk(input_file, start_frame, step, blur_sigma, frame_count, engine):
+    """
+    Функция вычисляет оптический поток для одного фрагмента видео (выполняется в процессе-исполнителе).
+    """
+
+    vs = []
+    us = []
+    image0 = None
+    for image1 in frame_generator(input_file, start_frame=start_frame, step=step, 
+                                  blur_sigma=blur_sigma, frame_count=frame_count, copy=False):
+        image1 = engine.prepare(image1)
+        if image0 is not None:
+            v, u = engine.compute(image0, image1)
             vs.append(v)
             us.append(u)
+        image0 = image1
+    if not vs:
+        return None
     return np.array(vs), np.array(us)
 
-def get_vid_opt_flow(input_file, cache_file, start_frame=0, step=1):
+def _init_flow_worker():
+    setNumThreads(1)
+
+def compute_optical_flow_parallel(input_file, start_frame=0, step=1, blur_sigma=None, 
+                                  frame_count=None, workers=None, chunk_size=32, out=None,
+                                  flow_stats=None, profiler=None, engine=None):
+    """
+    Функция вычисляет оптический поток в пуле процессов. Последовательность кадров делится на 
+    фрагменты по `chunk_size` пар кадров, соседние фрагменты перекрываются на один кадр. 
+    Каждый процесс сам читает свой фрагмент видео, результаты собираются в порядке кадров;
+    одновременно выполняется не более `2 * workers` фрагментов, поэтому готовые результаты
+    не накапливаются в памяти, если их запись отстает от вычисления.
+
+    :param input_file: str, путь к видеофайлу.
+    :param start_frame: int, опциональный параметр, номер первого кадра для чтения.
+    :param step: int, опциональный параметр, шаг между кадрами для чтения.
+    :param blur_sigma: float, опциональный параметр, стандартное отклонение для размытия изображения.
+    :param frame_count: int, номер кадра, до которого выполняется чтение (по умолчанию — длина видео).
+    :param workers: int, количество процессов (по умолчанию os.cpu_count()).
+    :param chunk_size: int, количество пар кадров в одном фрагменте (по умолчанию 32).
+    :param out: tuple, опционально: пара массивов (vs, us) формы (N, H, W) для записи результата.
+    :param flow_stats: FlowStatistics, опционально: накопитель статистик, обновляемый по мере вычисления.
+    :param profiler: StageProfiler, опционально: общее время (чтение кадров и поток в процессах-исполнителях)
+            добавляется к этапу "flow".
+    :param engine: FlowEngine, опционально: метод вычисления потока (по умолчанию `FlowEngine()` — Farneback).
+    :return: tuple, компоненты оптического потока: vs (вертикальная компонента) и us (горизонтальная компонента).
+    """
+
+    if engine is None:
+        engine = FlowEngine()
+    if frame_count is None:
+        frame_count = video_length(input_file)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    frame_ids = range(start_frame, frame_count, step)
+    n_pairs = max(len(frame_ids) - 1, 0)
+    chunk_starts = list(range(0, n_pairs, chunk_size))
+    tasks = [(input_file, 
+              frame_ids[begin], 
+              step, 
+              blur_sigma, 
+              frame_ids[min(begin + chunk_size, n_pairs)] + 1,
+              engine) for begin in chunk_starts]
+
+    vs, us = (None, None) if out is None else out
+    count = 0
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_flow_worker) as executor:
+        for result in progress(bounded_map(executor, _compute_flow_chunk, tasks, 2 * workers), total=len(tasks)):
+            if result is None:
+                break
+            vs_chunk, us_chunk = result
+            if flow_stats is not None:
+                flow_stats.update(vs_chunk, us_chunk)
+            if vs is None:
+                vs = np.empty((n_pairs,) + vs_chunk.shape[1:], dtype=vs_chunk.dtype)
+                us = np.empty((n_pairs,) + us_chunk.shape[1:], dtype=us_chunk.dtype)
+            vs[count:count + len(vs_chunk)] = vs_chunk
+            us[count:count + len(us_chunk)] = us_chunk
+            count += len(vs_chunk)
+            if len(vs_chunk) < chunk_size:
+                # Видео закончилось раньше frame_count
+                break
+    if profiler is not None:
+        profiler.add("flow", time.perf_counter() - wall, time.process_time() - cpu, count)
+    if vs is None:
+        return np.empty((0, 0, 0), dtype=np.float32), np.empty((0, 0, 0), dtype=np.float32)
+    return vs[:count], us[:count]
+
+def get_vid_opt_flow(input_file, cache_file, start_frame=0, step=1, stream=False, workers=None, 
+                     cache_max_bytes=None, frames=None, flow_stats=None, profiler=None, engine=None,
+                     frame_count=None, storage="float32"):
     """
     Функция получает оптический поток из видеофайла или кэша.
 
+    Поток хранится в записи `FlowCache` в каталоге файла кэша; ключ записи учитывает содержимое видео
+    и все параметры потока, поэтому измененное видео или параметры не приводят к чтению устаревших данных.
+    В потоковом режиме (`stream=True`) поля записываются сразу в дисковые буферы `.npy` записи,
+    а результат возвращается как `np.memmap`, поэтому полный объем потока не загружается в память;
+    иначе результат копируется в память.
+
     :param video_path: str, путь к видеофайлу.
-    :param cache_path: str, путь к файлу кэша.
+    :param cache_path: str, путь к файлу кэша (записи кэша хранятся в его каталоге).
     :param start_frame: int, опциональный параметр, номер первого кадра для чтения (по умолчанию 0).
     :param step: int, опциональный параметр, шаг между кадрами для чтения (по умолчанию 1).
+    :param stream: bool, опциональный параметр, потоковый режим с дисковыми буферами (по умолчанию False).
+    :param workers: int, опциональный параметр, количество процессов для параллельного вычисления 
+            потока (по умолчанию None — последовательно).
+    :param cache_max_bytes: int, опциональный параметр, лимит размера каталога кэша в байтах.
+    :param frames: slice, опциональный параметр, диапазон кадров для чтения из кэша.
+    :param flow_stats: FlowStatistics, опциональный параметр, накопитель, в который добавляются статистики
+            потока: при вычислении — по мере получения полей, при чтении из кэша — сохраненные 
+            или вычисленные одним проходом по кэшу.
+    :param profiler: StageProfiler, опциональный параметр, сбор метрик этапов "decode" и "flow".
+    :param engine: FlowEngine, опциональный параметр, метод вычисления потока (по умолчанию `FlowEngine()` — 
+            Farneback); его описание входит в ключ кэша.
+    :param frame_count: int, опциональный параметр, номер кадра, до которого выполняется чтение 
+            (по умолчанию — длина видео по заголовку файла).
+    :param storage: str, опциональный параметр, формат хранения потока в кэше: 
+            "float32", "float16" или "int16" с масштабом для каждой компоненты (см. `FlowCache.commit`).
     :return: tuple, компоненты оптического потока: vs (вертикальная компонента) и us (горизонтальная компонента).
     """
 
-    if not os.path.exists(cache_file):
-        vs_np, us_np = compute_optical_flow(frame_generator(input_file, 
-                                                            blur_sigma=1, 
-                                                            start_frame=start_frame, 
-                                                            step=step, 
-                                                            frame_count=RECORD_DURATION),
-                                            gen_length=RECORD_DURATION)
-        np.savez(cache_file, vs=vs_np, us=us_np)
-    else:
-        with np.load(cache_file) as npzfile:
-            vs_np = npzfile["vs"]
-            us_np = npzfile["us"]
-    return vs_np, us_np
\ No newline at end of file
+    if frame_count is None:
+        frame_count = video_length(input_file)
+    vs_np, us_np = _get_vid_opt_flow_stream(input_file, cache_file, start_frame, step, workers, 
+                                            cache_max_bytes, frames, flow_stats, profiler, engine, frame_count, 
+                                            storage)
+    if stream:
+        return vs_np, us_np
+    return np.array(vs_np), np.array(us_np)
+
+def _get_vid_opt_flow_stream(input_file, cache_file, start_frame=0, step=1, workers=None, 
+                             cache_max_bytes=None, frames=None, flow_stats=None, profiler=None, engine=None,
+                             frame_count=None, storage="float32"):
+    if engine is None:
+        engine = FlowEngine()
+    blur_sigma = 1
+    cache = FlowCache(os.path.dirname(os.path.abspath(cache_file)), max_bytes=cache_max_bytes)
+    # Формат float32 не входит в ключ, чтобы сохранить совместимость с существующими записями
+    storage_params = {} if storage == "float32" else {"storage": storage}
+    key = cache.key(input_file, 
+                    start_frame=start_frame, 
+                    step=step, 
+                    blur_sigma=blur_sigma, 
+                    frame_count=frame_count, 
+                    **engine.config(),
+                    **storage_params)
+    cached = cache.get(key, frames)
+    if cached is not None:
+        if flow_stats is not None:
+            _merge_cached_stats(cache, key, flow_stats, cached, use_saved=frames is None)
+        return cached
+
+    while cached is None:
+        # Запись могла быть удалена другим процессом, работающим с тем же каталогом кэша, 
+        # между сохранением и чтением; тогда поток вычисляется заново
+        entry_stats = None if flow_stats is None else FlowStatistics(flow_stats.bins, flow_stats.value_range)
+        _compute_flow_entry(cache, key, input_file, start_frame, step, blur_sigma, frame_count, workers, 
+                            entry_stats, profiler, engine, storage)
+        cached = cache.get(key, frames)
+    if entry_stats is not None:
+        flow_stats.merge(entry_stats)
+    return cached
+
+def _compute_flow_entry(cache, key, input_file, start_frame, step, blur_sigma, frame_count, workers, 
+                        entry_stats, profiler, engine, storage):
+    generator = frame_generator(input_file, 
+                                blur_sigma=blur_sigma, 
+                                start_frame=start_frame, 
+                                step=step, 
+                                frame_count=frame_count,
+                                copy=False)
+    first_frame = next(generator, None)
+    if first_frame is None:
+        raise ValueError(f"No frames in {input_file}")
+    gen_length = len(range(start_frame, frame_count, step))
+    shape = (gen_length - 1,) + engine.prepare(first_frame).shape[:2]
+    tmp_dir, vs_out, us_out = cache.create(key, shape)
+    try:
+        if workers is not None:
+            generator.close()
+            vs_np, _ = compute_optical_flow_parallel(input_file, 
+                                                     blur_sigma=blur_sigma, 
+                                                     start_frame=start_frame, 
+                                                     step=step, 
+                                                     frame_count=frame_count,
+                                                     workers=workers,
+                                                     out=(vs_out, us_out),
+                                                     flow_stats=entry_stats,
+                                                     profiler=profiler,
+                                                     engine=engine)
+        else:
+            vs_np, _ = compute_optical_flow(itertools.chain([first_frame], generator),
+                                            gen_length=gen_length,
+                                            out=(vs_out, us_out),
+                                            flow_stats=entry_stats,
+                                            profiler=profiler,
+                                            engine=engine)
+        length = vs_np.shape[0]
+        vs_out.flush()
+        us_out.flush()
+        del vs_np, vs_out, us_out
+        if entry_stats is not None:
+            entry_stats.save(os.path.join(tmp_dir, "stats.npz"))
+    except BaseException:
+        cache.discard(tmp_dir)
+        raise
+    cache.commit(key, tmp_dir, length, meta={"input_file": os.path.abspath(input_file), 
+                                                  "flow": engine.config()}, 
+                 storage=storage)
+
+def _merge_cached_stats(cache, key, flow_stats, flow, use_saved=True):
+    stats_file = cache.path(key, "stats.npz")
+    entry_stats = None
+    if use_saved:
+        try:
+            entry_stats = FlowStatistics.load(stats_file)
+        except FileNotFoundError:
+            # Статистики не сохранены или запись удалена другим процессом
+            pass
+        else:
+            if (entry_stats.bins, entry_stats.value_range) != (flow_stats.bins, flow_stats.value_range):
+                entry_stats = None
+    if entry_stats is None:
+        entry_stats = FlowStatistics.from_arrays(*flow, bins=flow_stats.bins, value_range=flow_stats.value_range)
+    flow_stats.merge(entry_stats)
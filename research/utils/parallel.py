@@ -0,0 +1,22 @@
+from collections import deque
+
+
+def bounded_map(executor, fn, args_iter, max_pending):
+    """
+    Функция выполняет `fn(*args)` в пуле, сохраняя порядок результатов и ограничивая количество 
+    одновременно переданных задач (и, следовательно, данных в памяти).
+
+    :param executor: concurrent.futures.Executor, пул исполнителей.
+    :param fn: callable, выполняемая функция.
+    :param args_iter: iterable, аргументы вызовов `fn`.
+    :param max_pending: int, максимальное количество переданных в пул и еще не полученных задач.
+    :return: generator, результаты вызовов в порядке аргументов.
+    """
+
+    pending = deque()
+    for args in args_iter:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
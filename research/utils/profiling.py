@@ -0,0 +1,233 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from tqdm.auto import tqdm
+
+_PROGRESS_ENABLED = os.environ.get("TCW_PROGRESS", "1") not in ("0", "false", "False")
+
+
+def set_progress(enabled: bool):
+    """
+    Функция включает или отключает индикаторы выполнения (tqdm) во всех этапах обработки.
+    По умолчанию управляется переменной окружения `TCW_PROGRESS`.
+
+    :param enabled: bool, True — показывать индикаторы выполнения.
+    """
+
+    global _PROGRESS_ENABLED
+    _PROGRESS_ENABLED = bool(enabled)
+
+
+def progress(iterable, total=None, **kwargs):
+    """
+    Функция оборачивает итерацию в индикатор выполнения, если он включен (`set_progress`).
+
+    :param iterable: итерируемый объект.
+    :param total: int, опционально: общее количество элементов.
+    :return: итерируемый объект.
+    """
+
+    if not _PROGRESS_ENABLED:
+        return iterable
+    return tqdm(iterable, total=total, **kwargs)
+
+
+def current_rss_mb():
+    """
+    :return: float, текущий объем резидентной памяти процесса в МБ (None, если недоступно).
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_mb():
+    """
+    :return: float, пиковый объем резидентной памяти процесса с момента запуска в МБ.
+    """
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS — байты
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+class _RSSSampler:
+    """
+    Фоновый поток, отслеживающий пиковый RSS в течение этапа.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self):
+        if self._thread is None:
+            # Без /proc доступен только пиковый RSS процесса
+            return max_rss_mb()
+        self._stop.set()
+        self._thread.join()
+        return max(self.peak, current_rss_mb())
+
+
+class StageProfiler:
+    """
+    Сбор метрик по этапам обработки видео (чтение, поток, флуктуации, аппроксимация, отрисовка):
+    время (реальное и процессорное), количество обработанных кадров и пиковая память.
+
+    Этапы измеряются контекстным менеджером `stage`; короткие повторяющиеся участки внутри циклов
+    (например, чтение и вычисление потока для каждого кадра) суммируются через `timed` и `timed_iter`.
+    """
+
+    def __init__(self, enabled=True, sample_interval=0.05):
+        """
+        :param enabled: bool, при False все методы ничего не измеряют.
+        :param sample_interval: float, период опроса RSS внутри этапа в секундах.
+        """
+
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    def _entry(self, name):
+        return self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "frames": 0, "calls": 0})
+
+    def add(self, name, wall, cpu=0.0, frames=0):
+        """
+        Функция добавляет измерение к этапу `name`.
+
+        :param name: str, имя этапа.
+        :param wall: float, реальное время в секундах.
+        :param cpu: float, процессорное время в секундах.
+        :param frames: int, количество обработанных кадров.
+        """
+
+        if not self.enabled:
+            return
+        entry = self._entry(name)
+        entry["wall_s"] += wall
+        entry["cpu_s"] += cpu
+        entry["frames"] += frames
+        entry["calls"] += 1
+
+    @contextmanager
+    def stage(self, name, frames=0):
+        """
+        Контекстный менеджер для измерения этапа, включая пиковую память.
+
+        :param name: str, имя этапа.
+        :param frames: int, количество кадров, обрабатываемых на этапе.
+        """
+
+        if not self.enabled:
+            yield
+            return
+        sampler = _RSSSampler(self.sample_interval)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, frames)
+            entry = self._entry(name)
+            entry["peak_rss_mb"] = max(entry.get("peak_rss_mb", 0.0), sampler.stop())
+
+    @contextmanager
+    def timed(self, name, frames=1):
+        """
+        Легковесный контекстный менеджер для суммирования времени участка внутри цикла.
+
+        :param name: str, имя этапа.
+        :param frames: int, количество кадров, обрабатываемых участком.
+        """
+
+        if not self.enabled:
+            yield
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, frames)
+
+    def timed_iter(self, iterable, name):
+        """
+        Функция оборачивает итератор так, что время получения каждого элемента добавляется к этапу `name`.
+
+        :param iterable: итерируемый объект (например, генератор кадров).
+        :param name: str, имя этапа.
+        :return: generator.
+        """
+
+        iterator = iter(iterable)
+        if not self.enabled:
+            yield from iterator
+            return
+        while True:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - wall, time.process_time() - cpu, 0)
+                return
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, 1)
+            yield item
+
+    def record(self, **extra):
+        """
+        Функция формирует запись метрик.
+
+        :param extra: дополнительные поля записи (например, путь к видео).
+        :return: dict, запись метрик.
+        """
+
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(entry)
+            if entry["wall_s"] > 0 and entry["frames"]:
+                stages[name]["fps"] = entry["frames"] / entry["wall_s"]
+        return {**extra,
+                "timestamp": time.time(),
+                "total_wall_s": time.perf_counter() - self._start,
+                "max_rss_mb": max_rss_mb(),
+                "stages": stages}
+
+    def emit(self, metrics_file=None, **extra):
+        """
+        Функция выводит запись метрик одной строкой JSON: дописывает в файл `metrics_file`
+        (формат JSON Lines) или печатает в stdout.
+
+        :param metrics_file: str, опционально: путь к файлу метрик.
+        :param extra: дополнительные поля записи.
+        :return: dict, запись метрик.
+        """
+
+        record = self.record(**extra)
+        if not self.enabled:
+            return record
+        line = json.dumps(record, default=str)
+        if metrics_file is None:
+            print(line)
+        else:
+            with open(metrics_file, "a") as f:
+                f.write(line + "\n")
+        return record
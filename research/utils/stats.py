@@ -2,10 +2,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats
 from matplotlib.animation import FFMpegWriter
-from tqdm import tqdm
 import math
+import cv2
+from concurrent.futures import ProcessPoolExecutor
 
-def plot_entire_stat_tresh(shape, vs_np, us_np, title="Sequence image sample", thresh = 0.95):
+from utils.flow_stats import FlowStatistics, mean_above
+from utils.parallel import bounded_map
+from utils.profiling import progress
+
+def plot_entire_stat_tresh(shape, vs_np, us_np, title="Sequence image sample", thresh = 0.95, flow_stats=None):
     """
     Функция для построения графика оптического потока и векторного поля.
 
@@ -14,10 +19,14 @@ def plot_entire_stat_tresh(shape, vs_np, us_np, title="Sequence image sample", t
     :param us_np: np.array, массив горизонтальных компонент оптического потока.
     :param title: str, заголовок графика (по умолчанию "Sequence image sample").
     :param thresh: float, порог для определения среднего значения оптического потока (по умолчанию 0.95).
+    :param flow_stats: FlowStatistics, опционально: накопленные статистики потока для оценки квантилей
+            (по умолчанию вычисляются одним проходом по массивам).
     """
     
-    v_mean = vs_np.mean(axis=0, where=vs_np>np.quantile(vs_np, thresh))# y direction    
-    u_mean = us_np.mean(axis=0, where=us_np>np.quantile(us_np, thresh))# x direction    
+    if flow_stats is None:
+        flow_stats = FlowStatistics.from_arrays(vs_np, us_np)
+    v_mean = mean_above(vs_np, flow_stats.quantile("v", thresh))# y direction    
+    u_mean = mean_above(us_np, flow_stats.quantile("u", thresh))# x direction    
     # --- Compute flow magnitude
     norm = np.sqrt(u_mean ** 2 + v_mean ** 2)
     # --- Display
@@ -41,9 +50,22 @@ def plot_entire_stat_tresh(shape, vs_np, us_np, title="Sequence image sample", t
 
     plt.show()
     
-def plot_entire_stat_mask(shape, vs_np, us_np, mask, title="Sequence image sample"):
-    v_mean = vs_np.mean(axis=0, where=mask)# y direction    
-    u_mean = us_np.mean(axis=0, where=mask)# x direction    
+def plot_entire_stat_mask(shape, vs_np, us_np, mask, title="Sequence image sample", flow_stats=None):
+    """
+    Функция для построения графика среднего по маске оптического потока и векторного поля.
+
+    :param shape: tuple, форма изображения (высота, ширина).
+    :param vs_np: np.array, массив вертикальных компонент оптического потока.
+    :param us_np: np.array, массив горизонтальных компонент оптического потока.
+    :param mask: np.array, маска формы (H, W) или (T, H, W).
+    :param title: str, заголовок графика (по умолчанию "Sequence image sample").
+    :param flow_stats: FlowStatistics, опционально: статистики, накопленные с этой маской
+            (по умолчанию вычисляются одним проходом по массивам).
+    """
+
+    if flow_stats is None or flow_stats.masked_sum is None:
+        flow_stats = FlowStatistics.from_arrays(vs_np, us_np, mask=mask)
+    v_mean, u_mean = flow_stats.masked_mean()
     # --- Compute flow magnitude
     norm = np.sqrt(u_mean ** 2 + v_mean ** 2)
     # --- Display
@@ -67,6 +89,108 @@ def plot_entire_stat_mask(shape, vs_np, us_np, mask, title="Sequence image sampl
 
     plt.show()
     
+def plot_fluctuation_maps(maps, title="Fluctuation maps"):
+    """
+    Функция для построения карт перекреста и наклонов режимов масштабирования по блокам кадра.
+
+    :param maps: dict, результат `compute_fluctuation_maps`.
+    :param title: str, заголовок графика (по умолчанию "Fluctuation maps").
+    """
+
+    fig, axs = plt.subplots(1, 3, figsize=(18, 6))
+    for ax, name, label in zip(axs, 
+                               ("crossover", "slope_l", "slope_h"), 
+                               ("Crossover S", "$H_l(S)$ slope", "$H_h(S)$ slope")):
+        image = ax.imshow(maps[name], interpolation='nearest')
+        fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04)
+        ax.set_title(label)
+        ax.axis('off')
+    fig.suptitle(f"{title} ({maps['tile']}x{maps['tile']} px tiles)")
+    plt.tight_layout()
+
+    plt.show()
+
+def _segment_fit(sx, sy, sxx, syy, sxy, n):
+    """
+    Функция вычисляет наклон и стандартную ошибку наклона линейной регрессии (как `stats.linregress`)
+    по суммам x, y, x^2, y^2, xy и количеству точек n.
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ssxx = sxx - sx ** 2 / n
+        ssyy = syy - sy ** 2 / n
+        ssxy = sxy - sx * sy / n
+        slope = ssxy / ssxx
+        sse = np.maximum(ssyy - ssxy * slope, 0)
+        stderr = np.sqrt(sse / (n - 2) / ssxx)
+    return slope, stderr
+
+def fit_crossover(hs, S, min_points=4):
+    """
+    Функция находит перекрест двух режимов масштабирования для одной или нескольких кривых H(S).
+    Для каждой точки разбиения cp вычисляется сумма стандартных ошибок наклонов регрессий 
+    log10(H) от log10(S) на участках [:cp] и [cp:]; все разбиения и все кривые обрабатываются
+    одновременно через кумулятивные суммы.
+
+    :param hs: массив формы (S,) или (B, S), значения флуктуаций.
+    :param S: массив формы (S,), временные масштабы.
+    :param min_points: int, минимальное количество точек на участке (по умолчанию 4).
+    :return: tuple, (cross, slope_l, slope_h, errs) — индекс перекреста, наклоны низкочастотного и 
+            высокочастотного режимов и ошибки для разбиений cp = min_points .. len(S)-min_points-1. 
+            Для одной кривой возвращаются скаляры и одномерный массив ошибок.
+    """
+
+    hs = np.asarray(hs, dtype=np.float64)
+    single = hs.ndim == 1
+    y = np.log10(np.atleast_2d(hs))
+    x = np.broadcast_to(np.log10(np.asarray(S, dtype=np.float64)), y.shape)
+    n_s = y.shape[-1]
+
+    def prefix(a):
+        return np.concatenate([np.zeros(a.shape[:-1] + (1,)), np.cumsum(a, axis=-1)], axis=-1)
+
+    sums = [prefix(a) for a in (x, y, x * x, y * y, x * y)]
+    cps = np.arange(min_points, n_s - min_points)
+    n_l = cps.astype(np.float64)
+    n_h = (n_s - cps).astype(np.float64)
+    _, err_l = _segment_fit(*[c[:, cps] for c in sums], n_l)
+    _, err_h = _segment_fit(*[c[:, -1:] - c[:, cps] for c in sums], n_h)
+    errs = err_l + err_h
+
+    cross = np.nanargmin(errs, axis=-1) + min_points
+    rows = np.arange(y.shape[0])
+    slope_l, _ = _segment_fit(*[c[rows, cross] for c in sums], cross.astype(np.float64))
+    slope_h, _ = _segment_fit(*[c[rows, -1] - c[rows, cross] for c in sums], (n_s - cross).astype(np.float64))
+    if single:
+        return int(cross[0]), slope_l[0], slope_h[0], errs[0]
+    return cross, slope_l, slope_h, errs
+
+def fit_crossover_curves(curves, S, min_points=4):
+    """
+    Функция применяет `fit_crossover` к набору кривых произвольной формы (..., S). Масштабы, не 
+    вычисленные ни для одной кривой, исключаются; для кривых с пропусками или неположительными 
+    значениями результаты равны NaN.
+
+    :param curves: массив формы (..., S), значения флуктуаций.
+    :param S: массив формы (S,), временные масштабы.
+    :param min_points: int, минимальное количество точек на участке (по умолчанию 4).
+    :return: tuple, (crossover, slope_l, slope_h) формы (...); crossover — масштаб перекреста.
+    """
+
+    curves = np.asarray(curves, dtype=np.float64)
+    shape = curves.shape[:-1]
+    curves = curves.reshape(-1, curves.shape[-1])
+    finite = np.isfinite(curves) & (curves > 0)
+    scale_ok = finite.any(axis=0)
+    rows_ok = finite[:, scale_ok].all(axis=1) & (scale_ok.sum() > 2 * min_points)
+    S = np.asarray(S)[scale_ok]
+
+    crossover, slope_l, slope_h = (np.full(len(curves), np.nan) for _ in range(3))
+    if rows_ok.any():
+        cross, slope_l[rows_ok], slope_h[rows_ok], _ = fit_crossover(curves[rows_ok][:, scale_ok], S, min_points)
+        crossover[rows_ok] = S[cross]
+    return crossover.reshape(shape), slope_l.reshape(shape), slope_h.reshape(shape)
+
 def analyze_hs(hs, S, output_file, plot=True, title="H(S)"):
     """
     Функция для анализа масштабирования флуктуаций сигнала.
@@ -82,13 +206,9 @@ def analyze_hs(hs, S, output_file, plot=True, title="H(S)"):
 
     """
     
-    errs = []
-    for cp in range(4, len(S)-4):
-        res1 = stats.linregress(np.log10(S[cp:]), np.log10(hs[cp:]))
-        res2 = stats.linregress(np.log10(S[:cp]), np.log10(hs[:cp]))
-        print(f"S={S[cp]}; Err={(res1.stderr + res2.stderr):.3f}")
-        errs.append(res1.stderr + res2.stderr)
-    cross = np.argmin(np.array(errs)) + 4
+    hs = np.asarray(hs)
+    S = np.asarray(S)
+    cross, _, _, errs = fit_crossover(hs, S)
     res_l = stats.linregress(np.log10(S[:cross]), np.log10(hs[:cross]))
     res_h = stats.linregress(np.log10(S[cross:]), np.log10(hs[cross:]))
     
@@ -128,40 +248,232 @@ def analyze_hs(hs, S, output_file, plot=True, title="H(S)"):
         plt.plot()
     return cross, res_l.slope, res_h.slope
 
-def make_animation(vs_np, us_np, output):
-    nl, nc = vs_np.shape[1:]
-    nvec = 25  # Number of vectors to be displayed along each image dimension
-    step = max(nl//nvec, nc//nvec)
+def _rank_pvalue(observed, null, two_sided=True):
+    """
+    Ранговое p-значение наблюдаемой величины относительно выборки `null` (..., N) с поправкой +1;
+    NaN в `null` не учитываются. Для ненаблюдаемой (не конечной) величины или пустой выборки — NaN.
+    """
+
+    null = np.asarray(null, dtype=np.float64)
+    observed = np.asarray(observed, dtype=np.float64)[..., None]
+    n = np.isfinite(null).sum(axis=-1)
+    upper = (1 + (null >= observed).sum(axis=-1)) / (n + 1)
+    if two_sided:
+        lower = (1 + (null <= observed).sum(axis=-1)) / (n + 1)
+        upper = np.minimum(1.0, 2 * np.minimum(upper, lower))
+    return np.where(np.isfinite(observed[..., 0]) & (n > 0), upper, np.nan)
+
+def surrogate_test(hs, S, surrogate_hs, ci=95, min_points=4):
+    """
+    Функция оценивает значимость масштабирования по суррогатам: перекрест и наклоны всех
+    суррогатных кривых находятся одним вызовом `fit_crossover_curves`, по их распределению
+    вычисляются процентильные интервалы и ранговые p-значения наблюдаемых величин.
 
-    low_perc = 0.1
-    hig_perc = 0.9
-    v_05 = np.quantile(vs_np, low_perc)# y direction    
-    v_95 = np.quantile(vs_np, hig_perc)# y direction    
-    u_05 = np.quantile(us_np, low_perc)# x direction
-    u_95 = np.quantile(us_np, hig_perc)# x direction
+    p-значение перекреста — доля суррогатов, у которых разность наклонов режимов |H_h - H_l| не меньше
+    наблюдаемой (односторонний критерий); p-значения наклонов и H(S) — двусторонние.
+
+    :param hs: массив формы (S,), наблюдаемые значения флуктуаций.
+    :param S: массив формы (S,), временные масштабы.
+    :param surrogate_hs: массив формы (N, S), значения флуктуаций суррогатов (см. `surrogate_fluctuations`).
+    :param ci: float, уровень интервалов в процентах (по умолчанию 95).
+    :param min_points: int, минимальное количество точек на участке регрессии (по умолчанию 4).
+    :return: dict, наблюдаемые crossover, slope_l, slope_h; их интервалы по суррогатам (`*_ci`) и
+            p-значения (`*_p`); hs_ci — интервалы H(S) формы (2, S), hs_p — p-значения по масштабам;
+            n_surrogates — количество суррогатов с успешной аппроксимацией.
+    """
+
+    S = np.asarray(S)
+    crossover, slope_l, slope_h = fit_crossover_curves(hs, S, min_points)
+    surr_cross, surr_l, surr_h = fit_crossover_curves(surrogate_hs, S, min_points)
+    fitted = np.isfinite(surr_cross)
+    surr_cross, surr_l, surr_h = surr_cross[fitted], surr_l[fitted], surr_h[fitted]
+
+    bounds = [(100 - ci) / 2, 100 - (100 - ci) / 2]
+    interval = lambda values: np.percentile(values, bounds) if len(values) else np.full(2, np.nan)
+    return {"crossover": float(crossover),
+            "slope_l": float(slope_l),
+            "slope_h": float(slope_h),
+            "crossover_ci": interval(surr_cross),
+            "slope_l_ci": interval(surr_l),
+            "slope_h_ci": interval(surr_h),
+            "hs_ci": np.nanpercentile(surrogate_hs, bounds, axis=0),
+            "crossover_p": float(_rank_pvalue(abs(slope_h - slope_l), np.abs(surr_h - surr_l), two_sided=False)),
+            "slope_l_p": float(_rank_pvalue(slope_l, surr_l)),
+            "slope_h_p": float(_rank_pvalue(slope_h, surr_h)),
+            "hs_p": _rank_pvalue(hs, np.asarray(surrogate_hs).T),
+            "n_surrogates": int(fitted.sum()),
+            "ci": ci}
+
+def plot_surrogate_test(hs, S, test, title="H(S) vs surrogates"):
+    """
+    Функция для построения наблюдаемой кривой H(S) на фоне процентильного интервала суррогатов.
+
+    :param hs: массив формы (S,), наблюдаемые значения флуктуаций.
+    :param S: массив формы (S,), временные масштабы.
+    :param test: dict, результат `surrogate_test`.
+    :param title: str, заголовок графика (по умолчанию "H(S) vs surrogates").
+    """
+
+    plt.figure()
+    plt.title(title)
+    plt.fill_between(S, test["hs_ci"][0], test["hs_ci"][1], facecolor='gray', alpha=0.35,
+                     label=f"{test['ci']}% surrogates ({test['n_surrogates']})")
+    plt.plot(S, hs, 'o', color='blue', 
+             label=f"$H(S)$: $H_l = {test['slope_l']:.2f}$ (p = {test['slope_l_p']:.3g}), "
+                   f"$H_h = {test['slope_h']:.2f}$ (p = {test['slope_h_p']:.3g})")
+    if np.isfinite(test["crossover"]):
+        plt.axvline(test["crossover"], label=f"S = {test['crossover']:g} (p = {test['crossover_p']:.3g})")
+    plt.legend()
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.grid(which='both')
+    plt.show()
+
+def _animation_limits(flow_stats, low_perc=0.1, hig_perc=0.9):
+    """
+    Функция вычисляет границы цветовой шкалы модуля потока для анимации по накопленным статистикам.
+    """
+
+    v_05 = flow_stats.quantile("v", low_perc)# y direction    
+    v_95 = flow_stats.quantile("v", hig_perc)# y direction    
+    u_05 = flow_stats.quantile("u", low_perc)# x direction
+    u_95 = flow_stats.quantile("u", hig_perc)# x direction
     # --- Compute flow magnitude
     magn_05 = np.sqrt(v_05 ** 2 + u_05 ** 2)
     magn_95 = np.sqrt(v_95 ** 2 + u_95 ** 2)
+    return magn_05, magn_95
 
-    
-    plt.style.use("ggplot")
-    fig = plt.figure(figsize=(10,15))
-    plt.axis('off')
-    writervideo = FFMpegWriter(fps=10) 
-    with writervideo.saving(fig, output, 100):
-        for v_np, u_np in tqdm(zip(vs_np, us_np)):
-            fig.clf()
-            # --- Display
-            # --- Quiver plot arguments
-            y, x = np.mgrid[:nl:step, :nc:step]
-            u_ = u_np[::step, ::step]
-            v_ = v_np[::step, ::step]
-
-            norm = np.sqrt(v_np ** 2 + u_np ** 2)
-            fig.gca().imshow(norm, vmin=magn_05, vmax=magn_95, cmap="jet")
-            fig.gca().quiver(x, y, u_, v_, color='r', units='dots',
-                    angles='xy', scale_units='xy', lw=3)
-            writervideo.grab_frame()
+def _animation_figure(v_np, u_np, magn_05, magn_95, step, figure_cls=None):
+    """
+    Функция создает фигуру анимации с изображением модуля потока и векторным полем.
+    Возвращает (fig, image, quiver) для последующего обновления через `set_data` и `set_UVC`.
+    """
+
+    nl, nc = v_np.shape
+    fig = plt.figure(figsize=(10,15)) if figure_cls is None else figure_cls(figsize=(10,15))
+    ax = fig.add_subplot()
+    y, x = np.mgrid[:nl:step, :nc:step]
+    image = ax.imshow(np.sqrt(v_np ** 2 + u_np ** 2), vmin=magn_05, vmax=magn_95, cmap="jet")
+    quiver = ax.quiver(x, y, u_np[::step, ::step], v_np[::step, ::step], color='r', units='dots',
+                       angles='xy', scale_units='xy', lw=3)
+    return fig, image, quiver
+
+def _update_animation_figure(image, quiver, v_np, u_np, step):
+    image.set_data(np.sqrt(v_np ** 2 + u_np ** 2))
+    # Масштаб стрелок подбирается автоматически для каждого кадра, как при пересоздании quiver
+    quiver.scale = None
+    quiver.set_UVC(u_np[::step, ::step], v_np[::step, ::step])
+
+def _render_frame_cv(v_np, u_np, magn_05, magn_95, step, upscale):
+    """
+    Функция рисует кадр анимации напрямую в массив uint8 (BGR): модуль потока в палитре jet и стрелки 
+    векторного поля с тем же автоматическим масштабом, что и у `quiver`.
+    """
+
+    nl, nc = v_np.shape
+    norm = np.sqrt(v_np ** 2 + u_np ** 2)
+    scaled = np.clip((norm - magn_05) / max(magn_95 - magn_05, np.finfo(np.float32).eps), 0, 1)
+    frame = cv2.applyColorMap((scaled * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    frame = cv2.resize(frame, (nc * upscale, nl * upscale), interpolation=cv2.INTER_NEAREST)
+
+    y, x = np.mgrid[:nl:step, :nc:step]
+    u_ = u_np[::step, ::step]
+    v_ = v_np[::step, ::step]
+    a = np.hypot(u_, v_)
+    amean = a.mean()
+    if amean > 0:
+        sn = max(10, math.sqrt(a.size))
+        length_scale = nc / (1.8 * amean * sn)
+        thickness = max(1, int(round(0.06 * nc * upscale / sn)))
+        x0 = ((x + 0.5) * upscale).ravel()
+        y0 = ((y + 0.5) * upscale).ravel()
+        x1 = x0 + (u_ * length_scale * upscale).ravel()
+        y1 = y0 + (v_ * length_scale * upscale).ravel()
+        for pt0, pt1 in zip(np.stack([x0, y0], -1).astype(int), np.stack([x1, y1], -1).astype(int)):
+            cv2.arrowedLine(frame, tuple(pt0.tolist()), tuple(pt1.tolist()), (0, 0, 255), 
+                            thickness, cv2.LINE_AA, tipLength=0.3)
+    return frame
+
+def _render_chunk(backend, vs_chunk, us_chunk, magn_05, magn_95, step, upscale):
+    """
+    Функция рисует фрагмент анимации в список кадров uint8 (BGR). Выполняется в процессе-исполнителе.
+    """
+
+    if backend == "opencv":
+        return [_render_frame_cv(v_np, u_np, magn_05, magn_95, step, upscale) 
+                for v_np, u_np in zip(vs_chunk, us_chunk)]
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    frames = []
+    with plt.style.context("ggplot"):
+        fig, image, quiver = _animation_figure(vs_chunk[0], us_chunk[0], magn_05, magn_95, step, Figure)
+        canvas = FigureCanvasAgg(fig)
+        for v_np, u_np in zip(vs_chunk, us_chunk):
+            _update_animation_figure(image, quiver, v_np, u_np, step)
+            canvas.draw()
+            frames.append(cv2.cvtColor(np.asarray(canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR))
+    return frames
+
+def make_animation(vs_np, us_np, output, backend="matplotlib", workers=None, chunk_size=32, fps=10, 
+                   flow_stats=None):
+    """
+    Функция сохраняет анимацию модуля и векторного поля оптического потока.
+
+    :param vs_np: np.array, (T, H, W) вертикальные компоненты оптического потока.
+    :param us_np: np.array, (T, H, W) горизонтальные компоненты оптического потока.
+    :param output: str, путь к файлу анимации.
+    :param backend: str, опционально: "matplotlib" (по умолчанию) — Matplotlib с переиспользованием 
+            artist-объектов, "opencv" — отрисовка напрямую в кадры uint8, None — анимация не создается.
+    :param workers: int, опционально: количество процессов для параллельной отрисовки фрагментов 
+            (кадры записываются через `cv2.VideoWriter`).
+    :param chunk_size: int, опционально: количество кадров в одном фрагменте (по умолчанию 32).
+    :param fps: int, опционально: частота кадров (по умолчанию 10).
+    :param flow_stats: FlowStatistics, опционально: накопленные статистики потока для границ цветовой 
+            шкалы (по умолчанию вычисляются одним проходом по массивам).
+    """
+
+    if backend is None:
+        return
+    nl, nc = vs_np.shape[1:]
+    nvec = 25  # Number of vectors to be displayed along each image dimension
+    step = max(nl//nvec, nc//nvec)
+    if flow_stats is None:
+        flow_stats = FlowStatistics.from_arrays(vs_np, us_np)
+    magn_05, magn_95 = _animation_limits(flow_stats)
+
+    if backend == "matplotlib" and workers is None:
+        plt.style.use("ggplot")
+        writervideo = FFMpegWriter(fps=fps) 
+        fig, image, quiver = _animation_figure(vs_np[0], us_np[0], magn_05, magn_95, step)
+        with writervideo.saving(fig, output, 100):
+            for v_np, u_np in progress(zip(vs_np, us_np), total=len(vs_np)):
+                _update_animation_figure(image, quiver, v_np, u_np, step)
+                writervideo.grab_frame()
+        plt.close(fig)
+        return
+
+    upscale = max(1, 1000 // max(nl, nc))
+    chunks = ((backend, np.asarray(vs_np[i:i + chunk_size]), np.asarray(us_np[i:i + chunk_size]), 
+               magn_05, magn_95, step, upscale) for i in range(0, len(vs_np), chunk_size))
+    writer = None
+    executor = None if workers is None else ProcessPoolExecutor(max_workers=workers)
+    try:
+        if executor is None:
+            results = (_render_chunk(*chunk) for chunk in chunks)
+        else:
+            results = bounded_map(executor, _render_chunk, chunks, 2 * workers)
+        for frames in progress(results, total=math.ceil(len(vs_np) / chunk_size)):
+            for frame in frames:
+                if writer is None:
+                    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), fps, 
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+        if executor is not None:
+            executor.shutdown()
 
 def compute_temporal_scales(base: float, smin: float, smax: float) -> list[int]:
     """
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+
+def synthetic_motion_frames(n_frames, height, width, drift=(0.5, 1.0), jitter=0.5, texture_sigma=3.0,
+                            noise_std=2.0, dtype=np.uint8, seed=0):
+    """
+    Функция генерирует последовательность кадров с движением текстуры (векторизованно, без цикла по кадрам).
+
+    Кадры — окна размера (height, width) на общей гладкой случайной текстуре, смещение окна задается
+    постоянным дрейфом и случайным блужданием, к кадрам добавляется независимый шум.
+
+    :param n_frames: int, количество кадров.
+    :param height: int, высота кадра.
+    :param width: int, ширина кадра.
+    :param drift: tuple, постоянное смещение (dy, dx) в пикселях за кадр.
+    :param jitter: float, стандартное отклонение случайного смещения за кадр.
+    :param texture_sigma: float, масштаб сглаживания текстуры.
+    :param noise_std: float, стандартное отклонение шума кадров (в единицах яркости).
+    :param dtype: тип данных кадров (np.uint8 для видео, np.uint16 для стеков ZVI).
+    :param seed: int, зерно генератора случайных чисел.
+    :return: np.array, массив кадров формы (n_frames, height, width).
+    """
+
+    rng = np.random.default_rng(seed)
+    steps = np.asarray(drift, dtype=np.float64) + rng.normal(0, jitter, size=(n_frames, 2))
+    offsets = np.round(np.cumsum(steps, axis=0)).astype(np.int64)
+    offsets -= offsets.min(axis=0)
+    span = offsets.max(axis=0)
+
+    max_value = np.iinfo(dtype).max
+    texture = gaussian_filter(rng.random((height + span[0] + 1, width + span[1] + 1)), texture_sigma)
+    texture = (texture - texture.min()) / (np.ptp(texture) + 1e-12) * 0.8 * max_value + 0.1 * max_value
+
+    rows = offsets[:, 0, None] + np.arange(height)
+    cols = offsets[:, 1, None] + np.arange(width)
+    frames = texture[rows[:, :, None], cols[:, None, :]]
+    if noise_std:
+        frames += rng.normal(0, noise_std * max_value / 255, size=frames.shape)
+    return np.clip(frames, 0, max_value).astype(dtype)
+
+
+def write_synthetic_video(path, frames, fps=25):
+    """
+    Функция записывает кадры в видеофайл (кодек MJPG).
+
+    :param path: str, путь к видеофайлу (.avi).
+    :param frames: np.array, (T, H, W) кадры uint8.
+    :param fps: int, частота кадров.
+    """
+
+    height, width = frames.shape[1:]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    try:
+        for frame in frames:
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    finally:
+        writer.release()
+
+
+class SyntheticScene:
+    """
+    Сцена с интерфейсом `slideio.Scene` для стека кадров в памяти (имитация временного ряда ZVI).
+    """
+
+    def __init__(self, frames):
+        """
+        :param frames: np.array, (T, H, W) стек кадров.
+        """
+
+        self.frames = frames
+        self.num_t_frames = frames.shape[0]
+
+    def read_block(self, rect=(0,0,0,0), size=(0,0), channel_indices=(0,), slices=(0,1), frames=(0,1)):
+        block = self.frames[frames[0]:frames[1]].copy()
+        return block[0] if len(block) == 1 else block
@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+def default_group(name):
+    """
+    Функция определяет группу записи по имени файла (`<имя>_<группа>.csv`, например `m12_alz`).
+    """
+
+    return name.split('_')[-1]
+
+
+class TrajectoryStore:
+    """
+    Бинарное хранилище траекторий частей тела.
+
+    Траектории всех файлов записываются подряд в один массив `data.bin` формы (rows, C) (по умолчанию
+    float32), который читается как `np.memmap`; `index.json` содержит имена столбцов и для каждого
+    файла — имя, группу, исходный путь, смещение и длину. CSV разбираются один раз при `ingest`.
+    """
+
+    DATA_FILE = "data.bin"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, store_dir):
+        """
+        :param store_dir: str, каталог хранилища (созданного `TrajectoryStore.ingest`).
+        """
+
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, self.INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.columns = self.index["columns"]
+        self.files = self.index["files"]
+        shape = (self.index["rows"], len(self.columns))
+        if self.index["rows"]:
+            self.data = np.memmap(os.path.join(store_dir, self.DATA_FILE), dtype=self.index["dtype"],
+                                  mode='r', shape=shape)
+        else:
+            self.data = np.empty(shape, dtype=self.index["dtype"])
+        self._positions = {entry["name"]: i for i, entry in enumerate(self.files)}
+
+    @classmethod
+    def ingest(cls, csv_files, store_dir, columns=None, dtype=np.float32, group_fn=default_group):
+        """
+        Функция за один проход по CSV-файлам траекторий создает хранилище: строки, в которых все
+        выбранные столбцы пусты, отбрасываются (как `dropna(how='all')`). Хранилище записывается
+        во временный каталог, который затем переименовывается в `store_dir`; прежнее хранилище
+        предварительно отодвигается в сторону и удаляется только после замены, поэтому в любой момент
+        существует целое хранилище (при сбое между переименованиями — в каталоге `<store_dir>.<id>.old`).
+
+        :param csv_files: list, пути к CSV-файлам (первый столбец — индекс кадра).
+        :param store_dir: str, каталог хранилища.
+        :param columns: list, опционально: столбцы для сохранения (по умолчанию все столбцы первого файла).
+        :param dtype: тип данных хранилища (по умолчанию np.float32).
+        :param group_fn: callable, функция получения группы по имени файла (по умолчанию `default_group`).
+        :return: TrajectoryStore.
+        """
+
+        tmp_dir = f"{os.path.abspath(store_dir).rstrip(os.sep)}.{uuid.uuid4().hex}.part"
+        os.makedirs(tmp_dir)
+        try:
+            files = []
+            rows = 0
+            with open(os.path.join(tmp_dir, cls.DATA_FILE), 'wb') as out:
+                for path in csv_files:
+                    data = pd.read_csv(path, index_col=0)
+                    if columns is None:
+                        columns = list(data.columns)
+                    data = data[columns].dropna(axis=0, how='all')
+                    out.write(np.ascontiguousarray(data.to_numpy(dtype=dtype)).tobytes())
+                    name = os.path.splitext(os.path.basename(path))[0]
+                    files.append({"name": name,
+                                  "group": group_fn(name) if group_fn is not None else None,
+                                  "path": os.path.abspath(path),
+                                  "offset": rows,
+                                  "length": len(data)})
+                    rows += len(data)
+            with open(os.path.join(tmp_dir, cls.INDEX_FILE), 'w') as f:
+                json.dump({"columns": list(columns or []), "dtype": np.dtype(dtype).name, "rows": rows,
+                           "files": files}, f, indent=1)
+            old_dir = None
+            if os.path.isdir(store_dir):
+                old_dir = f"{os.path.abspath(store_dir).rstrip(os.sep)}.{uuid.uuid4().hex}.old"
+                os.rename(store_dir, old_dir)
+            try:
+                os.rename(tmp_dir, store_dir)
+            except BaseException:
+                if old_dir is not None:
+                    os.rename(old_dir, store_dir)
+                raise
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        return cls(store_dir)
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def names(self):
+        """
+        :return: list, имена файлов.
+        """
+
+        return [entry["name"] for entry in self.files]
+
+    @property
+    def groups(self):
+        """
+        :return: list, группы файлов.
+        """
+
+        return [entry["group"] for entry in self.files]
+
+    @property
+    def lengths(self):
+        """
+        :return: np.array, длины траекторий.
+        """
+
+        return np.array([entry["length"] for entry in self.files], dtype=np.int64)
+
+    def min_length(self):
+        """
+        :return: int, минимальная длина траектории (длина, до которой обрезаются записи при анализе когорты).
+        """
+
+        return int(self.lengths.min())
+
+    def _column_ids(self, columns):
+        if columns is None:
+            return slice(None)
+        return [self.columns.index(column) for column in columns]
+
+    def get(self, key, columns=None, length=None):
+        """
+        Функция возвращает траектории одного файла.
+
+        :param key: str или int, имя файла или его номер.
+        :param columns: list, опционально: столбцы (по умолчанию все).
+        :param length: int, опционально: количество первых строк.
+        :return: np.array, (length, C) траектории (при `columns=None` — `np.memmap` без копирования).
+        """
+
+        entry = self.files[self._positions[key] if isinstance(key, str) else key]
+        stop = entry["length"] if length is None else min(length, entry["length"])
+        rows = self.data[entry["offset"]:entry["offset"] + stop]
+        return rows if columns is None else rows[:, self._column_ids(columns)]
+
+    def stack(self, columns=None, length=None, keys=None):
+        """
+        Функция собирает траектории нескольких файлов, обрезанные до общей длины, в один массив —
+        вход `detrended_covariances` для пакетной обработки.
+
+        :param columns: list, опционально: столбцы (по умолчанию все).
+        :param length: int, опционально: общая длина (по умолчанию минимальная по выбранным файлам).
+        :param keys: list, опционально: имена или номера файлов (по умолчанию все).
+        :return: np.array, (len(keys), length, C) траектории.
+        """
+
+        keys = range(len(self.files)) if keys is None else keys
+        entries = [self.files[self._positions[k] if isinstance(k, str) else k] for k in keys]
+        if length is None:
+            length = min(entry["length"] for entry in entries)
+        column_ids = self._column_ids(columns)
+        n_columns = len(self.columns) if columns is None else len(columns)
+        out = np.empty((len(entries), length, n_columns), dtype=self.data.dtype)
+        for i, entry in enumerate(entries):
+            if entry["length"] < length:
+                raise ValueError(f"Trajectory {entry['name']} is shorter than {length}")
+            out[i] = self.data[entry["offset"]:entry["offset"] + length][:, column_ids]
+        return out
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use("Agg")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, "research")))
+
+
+@pytest.fixture
+def flow():
+    # Синтетический поток (T, H, W) с ненулевым средним обеих компонент
+    rng = np.random.default_rng(0)
+    vs = rng.normal(0.3, 1.5, size=(90, 6, 5)).astype(np.float32)
+    us = rng.normal(-0.2, 0.7, size=(90, 6, 5)).astype(np.float32)
+    return vs, us
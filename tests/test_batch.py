@@ -0,0 +1,63 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+MAIN = os.path.join(os.path.dirname(__file__), os.path.pardir, "research", "Optical_Flow_Base_FA", "main.py")
+
+
+@pytest.fixture(scope="module")
+def main():
+    spec = importlib.util.spec_from_file_location("batch_main", MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def videos(tmp_path):
+    paths = []
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        path = tmp_path / folder / "vid.mp4"
+        path.write_bytes(b"frames")
+        paths.append(str(path))
+    return paths
+
+
+def _write_manifest(tmp_path, entries):
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps(entries))
+    return str(manifest)
+
+
+def test_same_basenames_get_distinct_outputs(main, videos, tmp_path):
+    jobs = main.load_jobs(_write_manifest(tmp_path, ["a/vid.mp4", {"input_file": "b/vid.mp4"}]),
+                          cache_dir=str(tmp_path / "cache"), output_dir=str(tmp_path / "out"))
+    assert [job["input_file"] for job in jobs] == videos
+    for key in ("cache_file", "output_animation_file", "output_fluctuation_file"):
+        assert len({job[key] for job in jobs}) == 2
+
+
+@pytest.mark.parametrize("entries", [[{"cache_file": "a.npz"}], [{"input_file": None}], [42], {"input_file": "a"}])
+def test_invalid_manifest_entries(main, tmp_path, entries):
+    with pytest.raises(ValueError):
+        main.load_jobs(_write_manifest(tmp_path, entries), cache_dir=str(tmp_path), output_dir=str(tmp_path))
+
+
+def test_job_is_up_to_date_requires_enabled_outputs(main, videos, tmp_path):
+    job, _ = main.load_jobs(_write_manifest(tmp_path, ["a/vid.mp4", "b/vid.mp4"]),
+                            cache_dir=str(tmp_path / "cache"), output_dir=str(tmp_path))
+    with open(main._job_state_file(job), 'w') as f:
+        json.dump({"video": main._video_stamp(job["input_file"]), "params": "digest", "record": {"frames": 1}}, f)
+    open(job["output_fluctuation_file"], 'w').close()
+    assert main.job_is_up_to_date(job, "digest", animation_backend=None) == {"frames": 1}
+    assert main.job_is_up_to_date(job, "other", animation_backend=None) is None
+    assert main.job_is_up_to_date(job, "digest") is None
+    assert main.job_is_up_to_date(job, "digest", animation_backend=None, tile_size=16) is None
+    assert main.job_is_up_to_date(job, "digest", animation_backend=None, n_surrogates=10) is None
+    base = os.path.splitext(job["output_fluctuation_file"])[0]
+    open(base + '_maps.npz', 'w').close()
+    open(base + '_surrogates.npz', 'w').close()
+    assert main.job_is_up_to_date(job, "digest", animation_backend=None, tile_size=16, n_surrogates=10) is not None
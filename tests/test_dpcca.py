@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dpcca import cohort_dpcca, detrended_covariances, dpcca, load_cohort, save_cohort
+
+SCALES = [5, 8, 13, 21, 34]
+
+
+def _reference_covariances(arr, scales, order, step):
+    # Прямой расчет: polyfit для каждого окна и каждого канала
+    profile = np.cumsum(arr - arr.mean(axis=0), axis=0)
+    T, C = arr.shape
+    f2 = np.empty((len(scales), C, C))
+    for i, s in enumerate(scales):
+        t = np.arange(s)
+        starts = range(0, T - s + 1, max(int(step * s), 1))
+        cov = np.zeros((C, C))
+        for start in starts:
+            window = profile[start:start + s]
+            resid = np.stack([window[:, c] - np.polyval(np.polyfit(t, window[:, c], order), t)
+                              for c in range(C)])
+            cov += resid @ resid.T
+        f2[i] = cov / (len(starts) * (s - 1))
+    return f2
+
+
+@pytest.fixture
+def channels():
+    # Три канала с общей компонентой: каналы 0 и 1 связаны только через канал 2
+    rng = np.random.default_rng(0)
+    common = rng.normal(size=400)
+    return np.stack([common + rng.normal(size=400),
+                     common + rng.normal(size=400),
+                     common + 0.3 * rng.normal(size=400)], axis=1)
+
+
+@pytest.mark.parametrize("order, step", [(1, 1.0), (2, 1.0), (2, 0.5), (3, 0.25)])
+def test_matches_per_window_polyfit(channels, order, step):
+    np.testing.assert_allclose(detrended_covariances(channels, SCALES, order, step),
+                               _reference_covariances(channels, SCALES, order, step), rtol=1e-8)
+
+
+def test_batched_sets_match_single(channels):
+    batch = np.stack([channels, channels[::-1], 2 * channels])
+    f2 = detrended_covariances(batch, SCALES)
+    for i in range(3):
+        np.testing.assert_allclose(f2[i], detrended_covariances(batch[i], SCALES), rtol=1e-12)
+
+
+def test_short_and_too_small_scales_are_nan(channels):
+    f2 = detrended_covariances(channels[:30], [3, 10, 50])
+    assert np.all(np.isnan(f2[0])) and np.all(np.isfinite(f2[1])) and np.all(np.isnan(f2[2]))
+
+
+def test_partial_correlations_from_inverse_matrix(channels):
+    p, r, f2, _ = dpcca(channels, SCALES)
+    for i in range(len(SCALES)):
+        diag = np.sqrt(np.diag(f2[i]))
+        np.testing.assert_allclose(r[i], f2[i] / np.outer(diag, diag), rtol=1e-12)
+        inv = np.linalg.inv(r[i])
+        expected = -inv / np.sqrt(np.outer(np.diag(inv), np.diag(inv)))
+        np.fill_diagonal(expected, 1)
+        np.testing.assert_allclose(p[i], expected, rtol=1e-8)
+        # Для трех каналов: r_01.2 = (r_01 - r_02 r_12) / sqrt((1 - r_02^2)(1 - r_12^2))
+        r01, r02, r12 = r[i, 0, 1], r[i, 0, 2], r[i, 1, 2]
+        assert p[i, 0, 1] == pytest.approx((r01 - r02 * r12) / np.sqrt((1 - r02 ** 2) * (1 - r12 ** 2)))
+    # Связь каналов 0 и 1 объясняется каналом 2
+    assert np.all(r[:, 0, 1] > 0.3)
+    assert np.all(np.abs(p[:, 0, 1]) < np.abs(r[:, 0, 1]))
+
+
+def test_cohort_matches_single_files(channels, tmp_path):
+    columns = ["head_x", "body_x", "tail_x"]
+    files = []
+    for i, arr in enumerate([channels, channels[::-1] * 2]):
+        path = tmp_path / f"track_{i}.csv"
+        pd.DataFrame(arr, columns=columns).to_csv(path)
+        files.append(str(path))
+    result = cohort_dpcca(files, columns, SCALES, workers=1)
+    assert result["p"].shape == (2, len(SCALES), 3, 3)
+    p, r, f2, _ = dpcca(channels, SCALES)
+    np.testing.assert_allclose(result["f2"][0], f2, rtol=1e-10)
+    np.testing.assert_allclose(result["p"][0], p, rtol=1e-10)
+
+
+def test_save_load_cohort_roundtrip(channels, tmp_path):
+    p, r, f2, scales = dpcca(channels, SCALES)
+    result = {"p": p, "r": r, "f2": f2, "scales": scales,
+              "files": ["a.csv", "b.csv"], "groups": ["control", None], "columns": ["x", "y", "z"]}
+    save_cohort(str(tmp_path / "cohort.npz"), result)
+    loaded = load_cohort(str(tmp_path / "cohort.npz"))
+    assert set(loaded) == set(result)
+    for key in ("p", "r", "f2", "scales"):
+        np.testing.assert_array_equal(loaded[key], result[key])
+    for key in ("files", "groups", "columns"):
+        assert loaded[key] == result[key]
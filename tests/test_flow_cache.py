@@ -0,0 +1,146 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from utils.data_generator import frame_generator
+from utils.flow_cache import FlowCache, QuantizedArray, quantize
+from utils.fluctuation import compute_fluctuations
+from utils.optical_flow import compute_optical_flow, get_vid_opt_flow
+from utils.synthetic import synthetic_motion_frames, write_synthetic_video
+
+SCALES = [4, 6, 9, 13, 20]
+
+
+def _put(cache, key, vs, us, length=None, storage="float32"):
+    length = len(vs) if length is None else length
+    tmp_dir, vs_out, us_out = cache.create(key, (length + 10,) + vs.shape[1:])
+    vs_out[:length] = vs[:length]
+    us_out[:length] = us[:length]
+    del vs_out, us_out
+    cache.commit(key, tmp_dir, length, storage=storage)
+
+
+def _cache_roundtrip(tmp_path, vs, us, storage, length):
+    source = tmp_path / "video.avi"
+    source.write_bytes(b"frames")
+    cache = FlowCache(str(tmp_path / "cache"))
+    key = cache.key(str(source), storage=storage)
+    _put(cache, key, vs, us, length, storage)
+    return cache.get(key)
+
+
+def test_float32_storage_is_exact(tmp_path, flow):
+    vs, us = flow
+    vs_c, us_c = _cache_roundtrip(tmp_path, vs, us, "float32", 40)
+    assert isinstance(vs_c, np.memmap)
+    np.testing.assert_array_equal(vs_c, vs[:40])
+    np.testing.assert_array_equal(us_c, us[:40])
+
+
+@pytest.mark.parametrize("storage, rtol", [("float16", 1e-3), ("int16", 1e-4)])
+def test_quantized_storage_matches_float32(tmp_path, flow, storage, rtol):
+    vs, us = flow
+    vs_c, us_c = _cache_roundtrip(tmp_path, vs, us, storage, 40)
+    assert isinstance(vs_c, QuantizedArray)
+    assert vs_c.shape == (40,) + vs.shape[1:]
+    for arr, ref in ((vs_c, vs[:40]), (us_c, us[:40])):
+        values = np.asarray(arr)
+        assert values.dtype == np.float32
+        # Ошибка не превышает половины шага квантования (с учетом округления результата до float32)
+        step = arr.scale if storage == "int16" else np.spacing(np.abs(ref).astype(np.float16)).astype(np.float32)
+        assert np.all(np.abs(values - ref) <= step / 2 + np.abs(ref) * np.finfo(np.float32).eps)
+        np.testing.assert_array_equal(arr[5:9], values[5:9])
+    np.testing.assert_allclose(compute_fluctuations(vs_c, us_c, SCALES),
+                               compute_fluctuations(vs[:40], us[:40], SCALES), rtol=rtol)
+
+
+def test_quantize_int16_scale(flow):
+    vs, _ = flow
+    values, scale = quantize(vs, "int16")
+    assert values.dtype == np.int16
+    assert np.max(np.abs(values)) == np.iinfo(np.int16).max
+    np.testing.assert_allclose(values * scale, vs, rtol=0, atol=scale / 2 * (1 + 1e-9))
+    np.testing.assert_array_equal(quantize(np.zeros(3), "int16")[0], 0)
+
+
+def test_key_depends_on_params_content_and_frame_range(tmp_path):
+    source = tmp_path / "video.avi"
+    source.write_bytes(b"frames")
+    cache = FlowCache(str(tmp_path / "cache"))
+    key = cache.key(str(source), start_frame=0, frame_count=100, method="farneback")
+    assert cache.key(str(source), method="farneback", frame_count=100, start_frame=0) == key
+    assert cache.key(str(source), start_frame=0, frame_count=100, method="dis") != key
+    assert cache.key(str(source), start_frame=10, frame_count=100, method="farneback") != key
+    assert cache.key(str(source), start_frame=0, frame_count=50, method="farneback") != key
+    source.write_bytes(b"other frames")
+    assert cache.key(str(source), start_frame=0, frame_count=100, method="farneback") != key
+
+
+def test_frame_range_read(tmp_path, flow):
+    vs, us = flow
+    cache = FlowCache(str(tmp_path))
+    _put(cache, "entry", vs, us)
+    vs_c, us_c = cache.get("entry", slice(5, 15))
+    np.testing.assert_array_equal(vs_c, vs[5:15])
+    np.testing.assert_array_equal(us_c, us[5:15])
+    assert cache.get("missing") is None
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path, flow):
+    vs, us = flow
+    cache = FlowCache(str(tmp_path))
+    for age, key in enumerate(["a", "b", "c", "d"]):
+        _put(cache, key, vs, us)
+        os.utime(cache.path(key, "meta.json"), (1000 + age, 1000 + age))
+    # Чтение обновляет время последнего использования
+    cache.get("a")
+    size = max(size for _, _, size in cache.entries())
+    assert cache.evict(max_bytes=2 * size, keep="b") == ["c", "d"]
+    assert sorted(key for key, _, _ in cache.entries()) == ["a", "b"]
+    assert cache.evict(max_bytes=size, keep="b") == ["a"]
+
+
+def test_entries_removed_by_another_process(tmp_path, flow, monkeypatch):
+    vs, us = flow
+    cache = FlowCache(str(tmp_path))
+    _put(cache, "a", vs, us)
+    _put(cache, "b", vs, us)
+    getsize = os.path.getsize
+
+    def getsize_while_removing(path):
+        if os.path.basename(os.path.dirname(path)) == "a":
+            raise FileNotFoundError(path)
+        return getsize(path)
+
+    monkeypatch.setattr(os.path, "getsize", getsize_while_removing)
+    assert [key for key, _, _ in cache.entries()] == ["b"]
+    monkeypatch.undo()
+    # Запись удалена частично: meta.json еще существует, массивов уже нет
+    os.remove(cache.path("a", "vs.npy"))
+    assert cache.get("a") is None
+    shutil.rmtree(cache.path("b", ""))
+    assert cache.get("b") is None
+    assert cache.evict(max_bytes=0) == ["a"]
+
+
+def test_flow_is_recomputed_when_entry_is_evicted_before_reading(tmp_path, monkeypatch):
+    video = str(tmp_path / "video.avi")
+    write_synthetic_video(video, synthetic_motion_frames(12, 32, 48, seed=0))
+    commit = FlowCache.commit
+    commits = []
+
+    def commit_then_evict(self, key, *args, **kwargs):
+        commit(self, key, *args, **kwargs)
+        commits.append(key)
+        if len(commits) == 1:
+            # Другой процесс вытесняет запись сразу после сохранения
+            shutil.rmtree(self.path(key, ""))
+
+    monkeypatch.setattr(FlowCache, "commit", commit_then_evict)
+    vs, us = get_vid_opt_flow(video, str(tmp_path / "cache" / "flow.npz"))
+    assert len(commits) == 2
+    vs_ref, us_ref = compute_optical_flow(frame_generator(video, blur_sigma=1))
+    np.testing.assert_array_equal(vs, vs_ref)
+    np.testing.assert_array_equal(us, us_ref)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from utils.flow_stats import FlowStatistics
+
+QUANTILES = [0.001, 0.05, 0.25, 0.5, 0.75, 0.95, 0.999]
+
+
+@pytest.fixture
+def mask(flow):
+    return np.random.default_rng(1).random(flow[0].shape) > 0.7
+
+
+@pytest.mark.parametrize("component", ["v", "u"])
+def test_quantiles_match_numpy_inside_range(flow, component):
+    flow_stats = FlowStatistics.from_arrays(*flow, chunk=7)
+    values = np.sort((flow[0] if component == "v" else flow[1]).ravel())
+    width = (flow_stats.value_range[1] - flow_stats.value_range[0]) / flow_stats.bins
+    for q in QUANTILES:
+        # Оценка лежит между соседними порядковыми статистиками с точностью до ширины интервала
+        k = q * values.size
+        lower = values[max(int(np.floor(k)) - 1, 0)] - width
+        upper = values[min(int(np.ceil(k)), values.size - 1)] + width
+        assert lower <= flow_stats.quantile(component, q) <= upper
+        assert flow_stats.quantile(component, q) == pytest.approx(np.quantile(values, q), abs=0.1)
+    assert flow_stats.quantile(component, 0) == pytest.approx(values.min())
+    assert flow_stats.quantile(component, 1) == pytest.approx(values.max())
+
+
+def test_quantiles_outside_range_are_interpolated_to_extremes():
+    # Значения за пределами диапазона гистограммы попадают в один интервал [hi, max]:
+    # квантиль внутри него — линейная интерполяция между границей диапазона и максимумом
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(0, 1, 9990), np.linspace(40, 1000, 10)]).astype(np.float32)
+    flow_stats = FlowStatistics(value_range=(-32, 32))
+    flow_stats.update(values.reshape(1, 100, 100), values.reshape(1, 100, 100))
+    q = 0.9995
+    n_over = 10
+    frac = (q * values.size - (values.size - n_over)) / n_over
+    expected = 32 + frac * (1000 - 32)
+    assert flow_stats.quantile("v", q) == pytest.approx(expected, rel=1e-6)
+    assert flow_stats.quantile("v", q) != pytest.approx(np.quantile(values, q), rel=0.1)
+    assert flow_stats.quantile("v", 1) == pytest.approx(1000)
+    # Более широкий диапазон возвращает точность
+    wide = FlowStatistics(bins=2 ** 16, value_range=(-1024, 1024))
+    wide.update(values.reshape(1, 100, 100), values.reshape(1, 100, 100))
+    assert wide.quantile("v", q) == pytest.approx(np.quantile(values, q), abs=2 * 2048 / 2 ** 16 + 1)
+
+
+def test_merge_matches_single_pass(flow, mask):
+    vs, us = flow
+    whole = FlowStatistics.from_arrays(vs, us, mask)
+    merged = FlowStatistics.from_arrays(vs[:40], us[:40], mask[:40])
+    merged.merge(FlowStatistics.from_arrays(vs[40:], us[40:], mask[40:]))
+    assert merged.count == whole.count == len(vs)
+    for c in ("v", "u"):
+        np.testing.assert_array_equal(merged.hist[c], whole.hist[c])
+        assert (merged.min[c], merged.max[c]) == (whole.min[c], whole.max[c])
+        np.testing.assert_allclose(merged.sum[c], whole.sum[c], rtol=1e-12)
+        np.testing.assert_allclose(merged.masked_sum[c], whole.masked_sum[c], rtol=1e-12)
+    np.testing.assert_array_equal(merged.masked_count, whole.masked_count)
+    with pytest.raises(ValueError):
+        merged.merge(FlowStatistics(bins=16))
+
+
+def test_means(flow, mask):
+    vs, us = flow
+    mask = mask.copy()
+    mask[:, 0, 0] = False
+    flow_stats = FlowStatistics.from_arrays(vs, us, mask)
+    v_mean, u_mean = flow_stats.mean()
+    np.testing.assert_allclose(v_mean, vs.mean(axis=0, dtype=np.float64), rtol=1e-10)
+    v_masked, u_masked = flow_stats.masked_mean()
+    expected = np.sum(us, axis=0, where=mask, dtype=np.float64)[1:, 1:] / mask.sum(axis=0)[1:, 1:]
+    np.testing.assert_allclose(u_masked[1:, 1:], expected, rtol=1e-10)
+    assert np.isnan(v_masked[0, 0]) and np.isnan(u_masked[0, 0])
+
+
+def test_save_load_roundtrip(flow, mask, tmp_path):
+    flow_stats = FlowStatistics.from_arrays(*flow, mask)
+    flow_stats.save(str(tmp_path / "stats.npz"))
+    loaded = FlowStatistics.load(str(tmp_path / "stats.npz"))
+    for q in QUANTILES:
+        assert loaded.quantile("u", q) == flow_stats.quantile("u", q)
+    np.testing.assert_array_equal(loaded.masked_mean()[0], flow_stats.masked_mean()[0])
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.fluctuation import (block_aggregate, compute_fluctuation_maps, compute_fluctuations, make_surrogates,
+                               surrogate_fluctuations)
+from utils.stats import fit_crossover_curves
+
+SCALES = [4, 5, 7, 8, 11, 16, 23, 40]
+
+
+def _reference_fluctuations(vs_np, us_np, temporal_scales):
+    # Исходная реализация из main.py: явные окна через sliding_window_view
+    vector_field = vs_np.astype(np.float64) + 1j * us_np.astype(np.float64)
+    hs = []
+    for w_size in temporal_scales:
+        window = sliding_window_view(vector_field, w_size, axis=0)[::w_size // 4, ...]
+        hs.append(np.std(np.sum(window, axis=-1)))
+    return np.array(hs)
+
+
+def test_matches_sliding_window_view(flow):
+    vs, us = flow
+    np.testing.assert_allclose(compute_fluctuations(vs, us, SCALES),
+                               _reference_fluctuations(vs, us, SCALES), rtol=1e-10)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 30])
+def test_chunking_does_not_change_result(flow, chunk_size):
+    vs, us = flow
+    np.testing.assert_allclose(compute_fluctuations(vs, us, SCALES, chunk_size=chunk_size),
+                               compute_fluctuations(vs, us, SCALES), rtol=1e-12)
+
+
+def test_memmap_input(flow, tmp_path):
+    vs, us = flow
+    np.save(tmp_path / "vs.npy", vs)
+    np.save(tmp_path / "us.npy", us)
+    vs_mm = np.load(tmp_path / "vs.npy", mmap_mode='r')
+    us_mm = np.load(tmp_path / "us.npy", mmap_mode='r')
+    np.testing.assert_allclose(compute_fluctuations(vs_mm, us_mm, SCALES),
+                               _reference_fluctuations(vs, us, SCALES), rtol=1e-10)
+
+
+def test_single_precision(flow):
+    vs, us = flow
+    np.testing.assert_allclose(compute_fluctuations(vs, us, SCALES, precision="single"),
+                               _reference_fluctuations(vs, us, SCALES), rtol=1e-4)
+
+
+@pytest.fixture
+def signal():
+    rng = np.random.default_rng(1)
+    return rng.normal(0.2, 1.0, size=(64, 3)) + 1j * rng.normal(-0.1, 1.0, size=(64, 3))
+
+
+def test_phase_surrogates_keep_amplitude_spectrum(signal):
+    surrogates = make_surrogates(signal, 5, "phase", rng=0)
+    assert surrogates.shape == (64, 5, 3)
+    amplitude = np.abs(np.fft.fft(signal, axis=0))
+    for i in range(5):
+        np.testing.assert_allclose(np.abs(np.fft.fft(surrogates[:, i], axis=0)), amplitude, rtol=1e-9)
+        np.testing.assert_allclose(surrogates[:, i].mean(axis=0), signal.mean(axis=0), rtol=1e-9)
+        assert not np.allclose(surrogates[:, i], signal)
+
+
+def test_shuffle_surrogates_are_permutations(signal):
+    surrogates = make_surrogates(signal, 5, "shuffle", rng=0)
+    assert surrogates.shape == (64, 5, 3)
+    for i in range(5):
+        # Перестановка общая для всех рядов: совпадают наборы строк (моментов времени) целиком
+        order = [np.flatnonzero(np.all(signal == row, axis=1)) for row in surrogates[:, i]]
+        assert all(len(index) == 1 for index in order)
+        assert sorted(int(index[0]) for index in order) == list(range(64))
+        assert not np.array_equal(surrogates[:, i], signal)
+
+
+def test_surrogate_batches_do_not_change_result(signal):
+    np.testing.assert_allclose(surrogate_fluctuations(signal, SCALES[:5], 10, batch_size=3),
+                               surrogate_fluctuations(signal, SCALES[:5], 10), rtol=1e-12)
+
+
+def test_full_frame_tile_reproduces_global_curve(flow):
+    vs, us = flow[0][:, :5, :5], flow[1][:, :5, :5]
+    maps = compute_fluctuation_maps(vs, us, SCALES, tile=5, min_points=3)
+    assert maps["hs"].shape == (1, 1, len(SCALES))
+    vs_mean = vs.mean(axis=(1, 2), dtype=np.float64)[:, None, None]
+    us_mean = us.mean(axis=(1, 2), dtype=np.float64)[:, None, None]
+    np.testing.assert_allclose(maps["hs"][0, 0], compute_fluctuations(vs_mean, us_mean, SCALES), rtol=1e-10)
+    crossover, slope_l, slope_h = fit_crossover_curves(maps["hs"][0, 0], SCALES, min_points=3)
+    assert np.isfinite(crossover) and maps["crossover"][0, 0] == crossover
+    assert (maps["slope_l"][0, 0], maps["slope_h"][0, 0]) == pytest.approx((slope_l, slope_h))
+
+
+def test_tiles_match_per_tile_curves(flow):
+    vs, us = flow
+    maps = compute_fluctuation_maps(vs, us, SCALES, tile=2)
+    vs_tiles, us_tiles = block_aggregate(vs, us, tile=2)
+    assert maps["hs"].shape == (3, 2, len(SCALES))
+    for i in range(3):
+        for j in range(2):
+            np.testing.assert_allclose(maps["hs"][i, j],
+                                       compute_fluctuations(vs_tiles[:, i:i + 1, j:j + 1],
+                                                            us_tiles[:, i:i + 1, j:j + 1], SCALES), rtol=1e-10)
+            np.testing.assert_allclose(vs_tiles[:, i, j], vs[:, 2 * i:2 * i + 2, 2 * j:2 * j + 2].mean(axis=(1, 2)),
+                                       atol=1e-6)
+
+
+def test_tiles_larger_than_frame_give_empty_maps(flow):
+    vs, us = flow
+    maps = compute_fluctuation_maps(vs, us, SCALES, tile=8)
+    for name in ("crossover", "slope_l", "slope_h"):
+        assert maps[name].shape == (0, 0)
+    assert maps["hs"].shape == (0, 0, len(SCALES))
+
+
+def test_scales_longer_than_series_are_nan(flow):
+    vs, us = flow[0][:30], flow[1][:30]
+    maps = compute_fluctuation_maps(vs, us, SCALES, tile=5)
+    assert np.all(np.isfinite(maps["hs"][..., :7])) and np.all(np.isnan(maps["hs"][..., 7:]))
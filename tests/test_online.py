@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from utils.fluctuation import compute_fluctuations
+from utils.online import OnlineFluctuationAnalyzer
+
+# Шаги окон 1, 1, 1, 2, 2, 4, 5: начало горизонта (кадр 40) кратно каждому из них
+SCALES = [4, 5, 7, 8, 11, 16, 20]
+
+
+def _feed(analyzer, vs, us):
+    results = [analyzer.update(v, u) for v, u in zip(vs, us)]
+    return [r for r in results if r is not None]
+
+
+@pytest.mark.parametrize("precision, rtol", [("double", 1e-12), ("single", 1e-4)])
+def test_matches_batch(flow, precision, rtol):
+    vs, us = flow
+    analyzer = OnlineFluctuationAnalyzer(SCALES, emit_every=30, precision=precision)
+    emitted = _feed(analyzer, vs, us)
+    assert [r["frame"] for r in emitted] == [30, 60, 90]
+    np.testing.assert_allclose(emitted[0]["hs"], compute_fluctuations(vs[:30], us[:30], SCALES), rtol=rtol)
+    np.testing.assert_allclose(analyzer.result()["hs"], compute_fluctuations(vs, us, SCALES), rtol=rtol)
+
+
+def test_horizon_matches_batch_on_tail(flow):
+    vs, us = flow
+    analyzer = OnlineFluctuationAnalyzer(SCALES, emit_every=90, horizon=50)
+    _feed(analyzer, vs, us)
+    np.testing.assert_allclose(analyzer.result()["hs"], compute_fluctuations(vs[40:], us[40:], SCALES),
+                               rtol=1e-10)
+
+
+def test_incomplete_scales_are_nan(flow):
+    vs, us = flow
+    analyzer = OnlineFluctuationAnalyzer(SCALES)
+    _feed(analyzer, vs[:6], us[:6])
+    hs = np.array(analyzer.result()["hs"])
+    assert np.all(np.isfinite(hs[:2])) and np.all(np.isnan(hs[2:]))
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from cv2 import calcOpticalFlowFarneback
+from scipy.ndimage import gaussian_filter
+
+from utils.optical_flow import FARNEBACK_PARAMS, FLOW_METHODS, FlowEngine, compute_optical_flow
+from utils.synthetic import synthetic_motion_frames
+
+SHIFT = (1, 2)
+
+
+def _texture(shape, seed=0):
+    # Гладкая случайная текстура в диапазоне [0, 1]
+    texture = gaussian_filter(np.random.default_rng(seed).random(shape), sigma=3)
+    return (texture - texture.min()) / (texture.max() - texture.min())
+
+
+def _drifting_pair(shape=(96, 96), max_value=255, dtype=np.uint8):
+    texture = _texture(shape)
+    frame0 = np.rint(texture * max_value).astype(dtype)
+    return frame0, np.roll(frame0, SHIFT, axis=(0, 1))
+
+
+def _interior_median(v, u, margin=12):
+    return np.median(v[margin:-margin, margin:-margin]), np.median(u[margin:-margin, margin:-margin])
+
+
+def test_farneback_passes_uint16_unchanged():
+    frame0, frame1 = _drifting_pair(max_value=4095, dtype=np.uint16)
+    engine = FlowEngine()
+    assert engine.prepare(frame0) is frame0
+    flow = calcOpticalFlowFarneback(prev=frame0, next=frame1, flow=None, **FARNEBACK_PARAMS)
+    v, u = engine(frame0, frame1)
+    np.testing.assert_array_equal(v, flow[..., 1])
+    np.testing.assert_array_equal(u, flow[..., 0])
+
+
+@pytest.mark.parametrize("method", ["farneback", "dis"])
+def test_12bit_frames_keep_flow_signal(method):
+    frame0, frame1 = _drifting_pair(max_value=4095, dtype=np.uint16)
+    v, u = _interior_median(*FlowEngine(method)(frame0, frame1))
+    np.testing.assert_allclose(np.abs([v, u]), SHIFT, atol=0.25)
+
+
+def test_dis_normalizes_by_data_range():
+    frame, _ = _drifting_pair(max_value=4095, dtype=np.uint16)
+    prepared = FlowEngine("dis").prepare(frame)
+    assert prepared.dtype == np.uint8
+    assert prepared.min() == 0 and prepared.max() == 255
+    prepared = FlowEngine("dis", value_range=(0, 65535)).prepare(frame)
+    assert prepared.max() == 16
+
+
+@pytest.mark.parametrize("method", FLOW_METHODS)
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+def test_roi_and_scale(method, scale):
+    frame0, frame1 = _drifting_pair(shape=(100, 120))
+    engine = FlowEngine(method, scale=scale, roi=(10, 6, 80, 64))
+    v, u = engine(frame0, frame1)
+    assert v.shape == u.shape == (int(64 * scale), int(80 * scale))
+    v, u = _interior_median(v, u, margin=int(12 * scale))
+    np.testing.assert_allclose(np.abs([v, u]), SHIFT, atol=0.35)
+
+
+@pytest.fixture
+def frames():
+    return list(synthetic_motion_frames(12, 32, 48, seed=0))
+
+
+@pytest.mark.parametrize("gen_length", [1, 5, 12, 20])
+def test_preallocated_flow_matches_list_path(frames, gen_length):
+    vs_ref, us_ref = compute_optical_flow(iter(frames))
+    vs, us = compute_optical_flow(iter(frames), gen_length=gen_length)
+    np.testing.assert_array_equal(vs, vs_ref)
+    np.testing.assert_array_equal(us, us_ref)
+
+
+def test_output_buffers_too_short(frames):
+    out = (np.empty((5, 32, 48), dtype=np.float32), np.empty((5, 32, 48), dtype=np.float32))
+    with pytest.raises(ValueError, match="Output buffers hold 5 flow fields"):
+        compute_optical_flow(iter(frames), out=out)
+    out = (np.empty((15, 32, 48), dtype=np.float32), np.empty((15, 32, 48), dtype=np.float32))
+    vs, us = compute_optical_flow(iter(frames), out=out)
+    np.testing.assert_array_equal(vs, compute_optical_flow(iter(frames))[0])
@@ -0,0 +1,23 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.parallel import bounded_map
+
+
+def test_bounded_map_keeps_order_and_limits_pending():
+    submitted = []
+    lock = threading.Lock()
+
+    def square(x):
+        with lock:
+            submitted.append(x)
+        return x * x
+
+    consumed = 0
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for result in bounded_map(executor, square, ((x,) for x in range(50)), max_pending=3):
+            assert result == consumed ** 2
+            consumed += 1
+            # Переданы только задачи, результаты которых уже получены, и не более max_pending следующих
+            assert len(submitted) <= consumed + 2
+    assert consumed == 50
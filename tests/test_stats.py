@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from utils.fluctuation import signal_fluctuations, surrogate_fluctuations
+from utils.stats import _rank_pvalue, compute_temporal_scales, fit_crossover, surrogate_test
+
+
+def _reference_crossover(hs, S, min_points=4):
+    # Исходный перебор из analyze_hs: linregress для каждой точки разбиения
+    x, y = np.log10(S), np.log10(hs)
+    errs = np.array([stats.linregress(x[cp:], y[cp:]).stderr + stats.linregress(x[:cp], y[:cp]).stderr
+                     for cp in range(min_points, len(S) - min_points)])
+    cross = int(np.argmin(errs)) + min_points
+    slope_l = stats.linregress(x[:cross], y[:cross]).slope
+    slope_h = stats.linregress(x[cross:], y[cross:]).slope
+    return cross, slope_l, slope_h, errs
+
+
+def _curve(rng, S, knee, noise=0.02):
+    # Две степенные зависимости с изломом на масштабе knee и мультипликативным шумом
+    hs = np.where(S < knee, S ** 0.9, knee ** 0.4 * S ** 0.5)
+    return hs * np.exp(rng.normal(0, noise, size=S.shape))
+
+
+@pytest.fixture
+def scales():
+    return np.unique(np.floor(8 * 1.1 ** np.arange(40))).astype(np.float64)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_linregress(scales, seed):
+    hs = _curve(np.random.default_rng(seed), scales, knee=scales[len(scales) // 3])
+    cross, slope_l, slope_h, errs = fit_crossover(hs, scales)
+    ref_cross, ref_slope_l, ref_slope_h, ref_errs = _reference_crossover(hs, scales)
+    assert cross == ref_cross
+    np.testing.assert_allclose(errs, ref_errs, rtol=1e-8)
+    np.testing.assert_allclose([slope_l, slope_h], [ref_slope_l, ref_slope_h], rtol=1e-10)
+
+
+def test_batch_matches_single_curves(scales):
+    rng = np.random.default_rng(0)
+    curves = np.stack([_curve(rng, scales, knee=k) for k in scales[6:30:3]])
+    cross, slope_l, slope_h, errs = fit_crossover(curves, scales)
+    for i, hs in enumerate(curves):
+        ref_cross, ref_slope_l, ref_slope_h, ref_errs = _reference_crossover(hs, scales)
+        assert cross[i] == ref_cross
+        np.testing.assert_allclose(errs[i], ref_errs, rtol=1e-8)
+        np.testing.assert_allclose([slope_l[i], slope_h[i]], [ref_slope_l, ref_slope_h], rtol=1e-10)
+
+
+def test_rank_pvalue_on_hand_made_null():
+    null = np.arange(1.0, 20.0)
+    # 4 из 19 значений не меньше наблюдаемого, 15 — не больше
+    assert _rank_pvalue(15.5, null, two_sided=False) == pytest.approx(5 / 20)
+    assert _rank_pvalue(15.5, null) == pytest.approx(2 * 5 / 20)
+    assert _rank_pvalue(100.0, null, two_sided=False) == pytest.approx(1 / 20)
+    assert _rank_pvalue(0.0, null) == pytest.approx(2 / 20)
+    assert _rank_pvalue(10.0, null) == pytest.approx(1.0)
+    # NaN в выборке не учитываются
+    assert _rank_pvalue(15.5, np.append(null, [np.nan, np.nan]), two_sided=False) == pytest.approx(5 / 20)
+    np.testing.assert_allclose(_rank_pvalue(np.array([15.5, 100.0]), np.stack([null, null]), two_sided=False),
+                               [5 / 20, 1 / 20])
+
+
+def test_rank_pvalue_without_observation_or_null():
+    assert np.isnan(_rank_pvalue(np.nan, np.arange(10.0)))
+    assert np.isnan(_rank_pvalue(1.0, np.full(10, np.nan)))
+
+
+def _white_and_correlated(T=2048, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(size=(T, 1)) + 1j * rng.normal(size=(T, 1))
+    # AR(1) с временем корреляции ~20 кадров: наклон ~1 на малых масштабах и ~0.5 на больших
+    correlated = np.empty_like(noise)
+    correlated[0] = noise[0]
+    for t in range(1, T):
+        correlated[t] = 0.95 * correlated[t - 1] + noise[t]
+    return noise, correlated
+
+
+def test_surrogate_test_crossover_significance():
+    S = np.array(compute_temporal_scales(1.1, 4, 2048 / 8))
+    noise, correlated = _white_and_correlated()
+    test = surrogate_test(signal_fluctuations(noise, S), S, surrogate_fluctuations(noise, S, 99))
+    assert test["n_surrogates"] == 99
+    assert test["crossover_p"] > 0.1
+    test = surrogate_test(signal_fluctuations(correlated, S), S, surrogate_fluctuations(correlated, S, 99))
+    assert test["crossover_p"] == pytest.approx(1 / 100)
+    assert test["slope_l_p"] < 0.05